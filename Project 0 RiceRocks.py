@@ -12,7 +12,39 @@ please visit the following URL with Google Chrome.
 """
 import simplegui
 import math
-import random
+import time
+try:
+    import os
+    import hashlib
+except ImportError:
+    # CodeSkulptor has neither, so assets are always loaded by URL there
+    os = None
+try:
+    import threading
+except ImportError:
+    threading = None
+# the finest clock available for profiling
+profile_clock = getattr(time, "perf_counter", time.time)
+try:
+    import struct
+except ImportError:
+    struct = None
+try:
+    import multiprocessing
+    from array import array
+except ImportError:
+    multiprocessing = None
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    from urllib2 import urlopen
+except ImportError:
+    try:
+        from urllib.request import urlopen
+    except ImportError:
+        urlopen = None
 
 # globals variables
 WIDTH = 800
@@ -21,6 +53,53 @@ ANGLE_VEL_INC = 0.04
 MISSILE_VEL = 5
 ROCK_VEL = 2
 MAX_ROCK_NUM = 12
+COLLISION_CELL_SIZE = 80
+FIXED_DT = 1.0 / 60         # seconds simulated by one tick
+MAX_FRAME_TIME = 0.25       # longest frame the GUI lets the world catch up on
+ROCK_SPAWN_INTERVAL = 60    # ticks between rock spawns
+SAFE_SPAWN_DISTANCE = 80    # rocks never spawn closer than this to the ship
+SPAWN_ATTEMPTS = 10         # positions tried before a rock is given up on
+
+# bit flags of the inputs held or pressed during a step
+INPUT_THRUST = 1
+INPUT_LEFT = 2
+INPUT_RIGHT = 4
+INPUT_FIRE = 8
+INPUT_START = 16
+
+# session logs start with this magic and store a checkpoint every interval
+REPLAY_MAGIC = "RRS2"
+REPLAY_CHECKPOINT_INTERVAL = 600
+
+# observations and rewards of the batch environment
+ENV_NEAREST_ROCKS = 4
+ENV_OBSERVATION_SIZE = 5 + 4 * ENV_NEAREST_ROCKS
+ENV_LIFE_PENALTY = 10
+
+# layout of world snapshots; images are stored by their index in ASSET_IDS
+SNAPSHOT_MAGIC = "RRW1"
+SNAPSHOT_HEADER = "<4sIIIiiBd"
+SNAPSHOT_SHIP = "<9dBB"
+SNAPSHOT_GROUP = "<BII"
+ASSET_IDS = ("ship", "asteroid", "missile", "explosion")
+
+# sprite handles keep the id in the low bits and its generation above them
+HANDLE_ID_BITS = 20
+HANDLE_ID_MASK = (1 << HANDLE_ID_BITS) - 1
+
+# where assets come from and where they are cached between runs
+ASSET_BASE_URL = "http://commondatastorage.googleapis.com/codeskulptor-assets/"
+ASSET_CACHE_DIR = ".ricerocks_assets"
+ASSET_OFFLINE = False       # True to never fetch assets over the network
+ASSET_FETCH_TIMEOUT = 10    # seconds the prefetcher waits for one asset
+
+DRAW_CALL_BUDGET = 150      # draw calls a frame may issue on slow browsers
+
+# phases timed and counters kept for each frame by the profiler
+PROFILE_FRAMES = 600
+PROFILE_PHASES = ("spawn", "sprites", "ship", "collide", "background", "draw")
+PROFILE_COUNTERS = ("sprite_count", "pair_tests")
+PROFILE_OVERLAY_INTERVAL = 30   # frames between refreshes of the overlay
 
 
 class ImageInfo:
@@ -73,33 +152,254 @@ class ImageInfo:
         return self._animated   
 
 
+class SilentSound:
+    """
+    Class standing in for a sound that is not available offline
+    """
+    def play(self):
+        """
+        Do nothing in place of playing
+        """
+        pass
+    
+    def pause(self):
+        """
+        Do nothing in place of pausing
+        """
+        pass
+    
+    def rewind(self):
+        """
+        Do nothing in place of rewinding
+        """
+        pass
+    
+    def set_volume(self, volume):
+        """
+        Do nothing in place of setting the volume
+        """
+        pass
+
+class AssetRegistry:
+    """
+    Class for loading images and sounds on first use.
+    
+    Where the os module is available, every file fetched from base_url 
+    is kept in cache_dir under the SHA-1 of its content, with an index 
+    from URL to digest, so later runs load it from local disk. Only the 
+    prefetcher fetches into the cache; an asset asked for before it is 
+    cached is loaded by URL. In offline mode nothing is fetched: uncached 
+    images are drawn as outlines and uncached sounds stay silent.
+    """
+    def __init__(self, base_url, cache_dir = None, offline = False):
+        self._base_url = base_url
+        self._cache_dir = cache_dir
+        self._offline = offline
+        self._images = {}
+        self._sounds = {}
+        self._loaded = {}
+        self._pending = []
+        self._index = None
+        if threading is not None:
+            self._lock = threading.Lock()
+        else:
+            self._lock = None
+        
+    def register_image(self, name, path, info):
+        """
+        Register an image by the path below base_url without loading it
+        """
+        self._images[name] = (path, info)
+        self._pending.append(name)
+        
+    def register_sound(self, name, path, volume = 1.0):
+        """
+        Register a sound by the path below base_url without loading it
+        """
+        self._sounds[name] = (path, volume)
+        self._pending.append(name)
+        
+    def get_info(self, name):
+        """
+        Getter for the ImageInfo of an image
+        Returns an ImageInfo object
+        """
+        return self._images[name][1]
+    
+    def image(self, name):
+        """
+        Load the image on first use
+        Returns an image, or None when it is not available offline
+        """
+        if name not in self._loaded:
+            location = self._locate(self._images[name][0])
+            if location is None:
+                self._loaded[name] = None
+            else:
+                self._loaded[name] = simplegui.load_image(location)
+        return self._loaded[name]
+    
+    def sound(self, name):
+        """
+        Load the sound on first use
+        Returns a sound, or a SilentSound when it is not available offline
+        """
+        if name not in self._loaded:
+            path, volume = self._sounds[name]
+            location = self._locate(path)
+            if location is None:
+                self._loaded[name] = SilentSound()
+            else:
+                self._loaded[name] = simplegui.load_sound(location)
+                self._loaded[name].set_volume(volume)
+        return self._loaded[name]
+    
+    def start_prefetch(self):
+        """
+        Fill the disk cache from a background thread, or where there are 
+        no threads, load one pending asset per timer tick
+        """
+        if threading is not None:
+            paths = [self._images[name][0] for name in self._images]
+            paths.extend([self._sounds[name][0] for name in self._sounds])
+            worker = threading.Thread(target = self._prefetch_paths, args = (paths,))
+            worker.daemon = True
+            worker.start()
+        else:
+            self._timer = simplegui.create_timer(50, self._prefetch_next)
+            self._timer.start()
+            
+    def _prefetch_paths(self, paths):
+        """
+        Make sure every path is in the disk cache
+        """
+        for path in paths:
+            self._locate(path, True)
+            
+    def _prefetch_next(self):
+        """
+        Timer handler that loads the next asset nobody has asked for yet
+        """
+        while self._pending and self._pending[0] in self._loaded:
+            self._pending.pop(0)
+        if not self._pending:
+            self._timer.stop()
+        elif self._pending[0] in self._images:
+            self.image(self._pending[0])
+        else:
+            self.sound(self._pending[0])
+            
+    def _locate(self, path, fetch = False):
+        """
+        Find where simplegui should load a registered path from, 
+        fetching it into the cache first when fetch is True
+        Returns a local file, a URL, or None when offline and not cached
+        """
+        url = self._base_url + path
+        if os is None or self._cache_dir is None:
+            if self._offline:
+                return None
+            return url
+        local = self._lookup(url)
+        if local is not None:
+            return local
+        if self._offline:
+            return None
+        if not fetch or urlopen is None:
+            return url
+        return self._fetch(url)
+        
+    def _lookup(self, url):
+        """
+        Look the URL up in the content-addressed cache, reading the 
+        index on first use
+        Returns a local file, or None when the URL is not cached
+        """
+        if self._lock is not None:
+            self._lock.acquire()
+        try:
+            if self._index is None:
+                self._index = {}
+                index_file = os.path.join(self._cache_dir, "index.txt")
+                if os.path.exists(index_file):
+                    with open(index_file) as index:
+                        for line in index:
+                            digest, cached_url = line.split(None, 1)
+                            self._index[cached_url.strip()] = digest
+            digest = self._index.get(url)
+        finally:
+            if self._lock is not None:
+                self._lock.release()
+        if digest is not None:
+            local = self._cache_file(url, digest)
+            if os.path.exists(local):
+                return local
+        return None
+        
+    def _fetch(self, url):
+        """
+        Fetch the URL into the cache; the lock is only held to add it 
+        to the index, so the GUI never waits on the network
+        Returns a local file, or the URL when the fetch failed
+        """
+        try:
+            content = urlopen(url, timeout = ASSET_FETCH_TIMEOUT).read()
+        except (IOError, OSError):
+            # leave it to simplegui to report the missing asset
+            return url
+        digest = hashlib.sha1(content).hexdigest()
+        local = self._cache_file(url, digest)
+        if not os.path.isdir(self._cache_dir):
+            os.makedirs(self._cache_dir)
+        with open(local, "wb") as cached:
+            cached.write(content)
+        if self._lock is not None:
+            self._lock.acquire()
+        try:
+            with open(os.path.join(self._cache_dir, "index.txt"), "a") as index:
+                index.write(digest + " " + url + "\n")
+            self._index[url] = digest
+        finally:
+            if self._lock is not None:
+                self._lock.release()
+        return local
+    
+    def _cache_file(self, url, digest):
+        """
+        Name the cache file holding the content with the given digest
+        Returns a path
+        """
+        return os.path.join(self._cache_dir, digest + os.path.splitext(url)[1])
+
+        
 ############### Register images and sound ###############
+assets = AssetRegistry(ASSET_BASE_URL, ASSET_CACHE_DIR, ASSET_OFFLINE)
+
 debris_info = ImageInfo([320, 240], [640, 480])
-debris_image = simplegui.load_image("http://commondatastorage.googleapis.com/codeskulptor-assets/lathrop/debris2_blue.png")
+assets.register_image("debris", "lathrop/debris2_blue.png", debris_info)
 
 nebula_info = ImageInfo([400, 300], [800, 600])
-nebula_image = simplegui.load_image("http://commondatastorage.googleapis.com/codeskulptor-assets/lathrop/nebula_blue.f2014.png")
+assets.register_image("nebula", "lathrop/nebula_blue.f2014.png", nebula_info)
 
 splash_info = ImageInfo([200, 150], [400, 300])
-splash_image = simplegui.load_image("http://commondatastorage.googleapis.com/codeskulptor-assets/lathrop/splash.png")
+assets.register_image("splash", "lathrop/splash.png", splash_info)
 
 ship_info = ImageInfo([45, 45], [90, 90], 35)
-ship_image = simplegui.load_image("http://commondatastorage.googleapis.com/codeskulptor-assets/lathrop/double_ship.png")
+assets.register_image("ship", "lathrop/double_ship.png", ship_info)
 
 missile_info = ImageInfo([5,5], [10, 10], 3, 50)
-missile_image = simplegui.load_image("http://commondatastorage.googleapis.com/codeskulptor-assets/lathrop/shot2.png")
+assets.register_image("missile", "lathrop/shot2.png", missile_info)
 
 asteroid_info = ImageInfo([45, 45], [90, 90], 40)
-asteroid_image = simplegui.load_image("http://commondatastorage.googleapis.com/codeskulptor-assets/lathrop/asteroid_blue.png")
+assets.register_image("asteroid", "lathrop/asteroid_blue.png", asteroid_info)
 
 explosion_info = ImageInfo([64, 64], [128, 128], 17, 24, True)
-explosion_image = simplegui.load_image("http://commondatastorage.googleapis.com/codeskulptor-assets/lathrop/explosion_alpha.png")
+assets.register_image("explosion", "lathrop/explosion_alpha.png", explosion_info)
 
-soundtrack = simplegui.load_sound("http://commondatastorage.googleapis.com/codeskulptor-assets/sounddogs/soundtrack.mp3")
-missile_sound = simplegui.load_sound("http://commondatastorage.googleapis.com/codeskulptor-assets/sounddogs/missile.mp3")
-missile_sound.set_volume(.5)
-ship_thrust_sound = simplegui.load_sound("http://commondatastorage.googleapis.com/codeskulptor-assets/sounddogs/thrust.mp3")
-explosion_sound = simplegui.load_sound("http://commondatastorage.googleapis.com/codeskulptor-assets/sounddogs/explosion.mp3")
+assets.register_sound("soundtrack", "sounddogs/soundtrack.mp3")
+assets.register_sound("missile", "sounddogs/missile.mp3", .5)
+assets.register_sound("thrust", "sounddogs/thrust.mp3")
+assets.register_sound("explosion", "sounddogs/explosion.mp3")
 
 
 # helper functions to handle transformations
@@ -117,49 +417,93 @@ def dist(item1,item2):
     """
     return math.sqrt((item1[0] - item2[0]) ** 2+(item1[1] - item2[1]) ** 2)
 
-def process_sprite_group(a_set, canvas):
+def wrapped_delta(pos1, pos2):
+    """
+    Calculate the shortest displacement from pos2 to pos1 on the 
+    wrap-around screen
+    Returns a list of two floats
+    """
+    delta_x = (pos1[0] - pos2[0]) % WIDTH
+    delta_y = (pos1[1] - pos2[1]) % HEIGHT
+    if delta_x > WIDTH / 2.0:
+        delta_x -= WIDTH
+    if delta_y > HEIGHT / 2.0:
+        delta_y -= HEIGHT
+    return [delta_x, delta_y]
+
+def swept_collide(prev_delta, motion, reach):
     """
-    Call the update and draw methods for each sprite in the group
+    Decide whether a point starting at prev_delta from another object and 
+    moving by motion relative to it comes within reach during the tick, 
+    so fast objects cannot pass through each other between two frames
+    Returns a Boolean
     """
-    for item in set(a_set):
-        item.draw(canvas)
-        item.update()
-        # remove the sprite when the age is greater than lifespan
-        if item.update() == True:
-            a_set.remove(item)            
-        
+    length_sq = motion[0] ** 2 + motion[1] ** 2
+    fraction = 0.0
+    if length_sq > 0:
+        # fraction of the tick at which the two objects are closest
+        fraction = -(prev_delta[0] * motion[0] + prev_delta[1] * motion[1]) / length_sq
+        fraction = max(0.0, min(1.0, fraction))
+    closest_x = prev_delta[0] + motion[0] * fraction
+    closest_y = prev_delta[1] + motion[1] * fraction
+    return closest_x ** 2 + closest_y ** 2 <= reach ** 2
+
+def lerp_position(prev_pos, pos, alpha):
+    """
+    Interpolate between the previous and current position on the 
+    wrap-around screen
+    Returns a list of two floats
+    """
+    delta = wrapped_delta(pos, prev_pos)
+    return [(prev_pos[0] + delta[0] * alpha) % WIDTH, 
+            (prev_pos[1] + delta[1] * alpha) % HEIGHT]
+
 
 class Ship:
     """
     Class for spaceship
     """
-    def __init__(self, pos, vel, angle, image, info):
+    def __init__(self, pos, vel, angle, asset, info):
         self._pos = [pos[0],pos[1]]
+        self._prev_pos = [pos[0],pos[1]]
         self._vel = [vel[0],vel[1]]
         self._thrust = False
         self._angle = angle
+        self._prev_angle = angle
         self._angle_vel = 0
-        self._image = image
+        self._asset = asset
         self._image_center = info.get_center()
         self._image_size = info.get_size()
         self._radius = info.get_radius()
         
-    def draw(self,canvas):
+    def draw(self, canvas, alpha = 1.0):
         """
-        Handler for drawing spaceship
+        Handler for drawing spaceship, alpha of the way from its 
+        previous to its current state
+        Returns the number of draw calls issued
         """
-        if self._thrust == False:
-            canvas.draw_image(self._image, self._image_center, 
-                              self._image_size, self._pos, self._image_size, self._angle)
+        pos = lerp_position(self._prev_pos, self._pos, alpha)
+        angle = self._prev_angle + (self._angle - self._prev_angle) * alpha
+        image = assets.image(self._asset)
+        if image is None:
+            canvas.draw_circle(pos, self._radius, 1, "White")
+        elif self._thrust == False:
+            canvas.draw_image(image, self._image_center, 
+                              self._image_size, pos, self._image_size, angle)
         else:
-            canvas.draw_image(self._image, 
+            canvas.draw_image(image, 
                               (self._image_center[0] + self._image_size[0], self._image_center[1])
-                              , self._image_size, self._pos, self._image_size, self._angle)
+                              , self._image_size, pos, self._image_size, angle)
+        return 1
 
     def update(self):
         """
         Update the position of spaceship
         """                
+        self._prev_pos[0] = self._pos[0]
+        self._prev_pos[1] = self._pos[1]
+        self._prev_angle = self._angle
+        
         # update position based on velocity
         self._pos[0] = (self._pos[0] + self._vel[0]) % WIDTH 
         self._pos[1] = (self._pos[1] + self._vel[1]) % HEIGHT        
@@ -177,30 +521,28 @@ class Ship:
             self._vel[0] += forward[0] / 10
             self._vel[1] += forward[1] / 10     
         
-    def angle_vel_update(self, angle_vel_inc):
+    def set_angle_vel(self, angle_vel):
         """
-        Increment the angular velocity by a fixed amount
+        Set the angular velocity
         """
-        self._angle_vel += angle_vel_inc
+        self._angle_vel = angle_vel
     
     def thrust_on(self):
         """
         Turn the thrusters on
         """
         self._thrust = True
-        ship_thrust_sound.play()
         
     def thrust_off(self):
         """
         Turn the thrusters off
         """
         self._thrust = False
-        ship_thrust_sound.rewind()
     
     def shoot(self):
         """
         Spawn a new missile
-        Return a Sprite object
+        Returns the position and velocity of the missile as two lists
         """        
         forward = angle_to_vector(self._angle)        
         # missile's initial position is the tip of ship's "cannon"
@@ -208,8 +550,7 @@ class Ship:
                        self._pos[1] + forward[1] * self._radius]                 
         missile_vel = [self._vel[0] + forward[0] * MISSILE_VEL, 
                        self._vel[1] + forward[1] * MISSILE_VEL]        
-        a_missile = Sprite(missile_pos, missile_vel, 0, 0, missile_image, missile_info, missile_sound)
-        return a_missile
+        return missile_pos, missile_vel
             
     def get_radius(self):
         """
@@ -225,242 +566,1771 @@ class Ship:
         """
         return self._pos    
 
-class Sprite:
+    def pack(self, buf):
+        """
+        Append the state of the ship to the bytearray
+        """
+        buf.extend(struct.pack(SNAPSHOT_SHIP, self._pos[0], self._pos[1], 
+                               self._prev_pos[0], self._prev_pos[1], 
+                               self._vel[0], self._vel[1], self._angle, 
+                               self._prev_angle, self._angle_vel, 
+                               self._thrust, ASSET_IDS.index(self._asset)))
+        
+    def unpack(self, data, offset):
+        """
+        Replace the state of the ship with the state packed at the offset
+        Returns the offset just past the state
+        """
+        state = struct.unpack_from(SNAPSHOT_SHIP, data, offset)
+        self._pos = [state[0], state[1]]
+        self._prev_pos = [state[2], state[3]]
+        self._vel = [state[4], state[5]]
+        self._angle, self._prev_angle, self._angle_vel = state[6:9]
+        self._thrust = bool(state[9])
+        self._asset = ASSET_IDS[state[10]]
+        return offset + struct.calcsize(SNAPSHOT_SHIP)
+    
+    def get_velocity(self):
+        """
+        Getter for ship velocity
+        Returns a list of two floats
+        """
+        return self._vel
+    
+    def get_angle(self):
+        """
+        Getter for ship angle
+        Returns a float
+        """
+        return self._angle
+    
+    def get_previous_position(self):
+        """
+        Getter for ship position before the last update
+        Returns a list of two floats
+        """
+        return self._prev_pos
+
+class SpriteGroup:
     """
-    Class for rocks and missiles
+    Class for a group of rocks, missiles or explosions sharing one image,
+    stored as parallel columns instead of one object per sprite.
+    
+    Removal swaps the last sprite into the freed row, so rows are not 
+    kept in any order; a sprite is tracked by the handle add returns, 
+    which goes stale once the sprite is removed and its id is reused.
     """
-    def __init__(self, pos, vel, ang, ang_vel, image, info, sound = None):
-        self._pos = [pos[0],pos[1]]
-        self._vel = [vel[0],vel[1]]
-        self._angle = ang
-        self._angle_vel = ang_vel
-        self._image = image
+    def __init__(self, asset, info):
+        self._asset = asset
         self._image_center = info.get_center()
         self._image_size = info.get_size()
         self._radius = info.get_radius()
         self._lifespan = info.get_lifespan()
         self._animated = info.get_animated()
-        self._age = 0
-        if sound:
-            sound.rewind()
-            sound.play()
-   
-    def draw(self, canvas):
+        self._frame_centers = [[self._image_center[0] + frame_index * self._image_size[0], 
+                                self._image_center[1]] for frame_index in range(24)]
+        self._generations = []
+        self.clear()
+        
+    def clear(self):
+        """
+        Remove every sprite from the group
+        """
+        self._clear_columns()
+        
+        # every id ever handed out is free again, with a new generation
+        self._rows = [None] * len(self._generations)
+        self._free_ids = list(range(len(self._generations)))
+        self._generations = [generation + 1 for generation in self._generations]
+        
+        # timing wheel of handles, one bucket per tick of the lifespan
+        self._tick = 0
+        if self._lifespan == float('inf'):
+            self._wheel = None
+        else:
+            self._wheel = [[] for dummy in range(int(self._lifespan) + 1)]
+        
+    def _clear_columns(self):
+        """
+        Empty every column
+        """
+        self._xs = []
+        self._ys = []
+        self._prev_xs = []
+        self._prev_ys = []
+        self._vxs = []
+        self._vys = []
+        self._angles = []
+        self._prev_angles = []
+        self._angle_vels = []
+        self._ages = []
+        self._ids = []
+        self._columns = (self._xs, self._ys, self._prev_xs, self._prev_ys, 
+                         self._vxs, self._vys, self._angles, self._prev_angles, 
+                         self._angle_vels, self._ages, self._ids)
+        
+    def __len__(self):
+        return len(self._xs)
+    
+    def add(self, pos, vel, ang, ang_vel):
+        """
+        Append a new sprite to the group
+        Returns an integer handle for the sprite
+        """
+        handle = self._allocate_handle(len(self))
+        self._append_row(pos, vel, ang, ang_vel)
+        self._schedule_expiry(handle, 0)
+        return handle
+    
+    def _append_row(self, pos, vel, ang, ang_vel):
+        """
+        Append the state of a new sprite to every column but the ids
         """
-        Handler for drawing rocks and missiles
+        self._xs.append(pos[0])
+        self._ys.append(pos[1])
+        self._prev_xs.append(pos[0])
+        self._prev_ys.append(pos[1])
+        self._vxs.append(vel[0])
+        self._vys.append(vel[1])
+        self._angles.append(ang)
+        self._prev_angles.append(ang)
+        self._angle_vels.append(ang_vel)
+        self._ages.append(0)
+    
+    def _allocate_handle(self, row):
+        """
+        Give the sprite in the row an id, reusing a free one if possible
+        Returns the handle of the sprite
         """
-        if not self._animated:
-            canvas.draw_image(self._image, self._image_center, self._image_size, 
-                              self._pos, self._image_size, self._angle)
+        if self._free_ids:
+            sprite_id = self._free_ids.pop()
         else:
-            # draw explosions
-            index = self._age % 24
-            new_center = [self._image_center[0] + index * self._image_size[0], self._image_center[1]]
-            canvas.draw_image(self._image, new_center, self._image_size, 
-                              self._pos, self._image_size, self._angle)
+            sprite_id = len(self._generations)
+            self._generations.append(0)
+            self._rows.append(None)
+        self._rows[sprite_id] = row
+        self._ids.append(sprite_id)
+        return (self._generations[sprite_id] << HANDLE_ID_BITS) | sprite_id
+    
+    def _schedule_expiry(self, handle, age):
+        """
+        Put the handle in the bucket of the tick where its age reaches 
+        the lifespan
+        """
+        if self._wheel is not None:
+            expiry = (self._tick + int(self._lifespan) - age) % len(self._wheel)
+            self._wheel[expiry].append(handle)
+    
+    def is_alive(self, handle):
+        """
+        Decide whether the sprite a handle refers to is still in the group
+        Returns a Boolean
+        """
+        sprite_id = handle & HANDLE_ID_MASK
+        return (sprite_id < len(self._generations) and 
+                self._generations[sprite_id] == handle >> HANDLE_ID_BITS)
+    
+    def kill(self, handle):
+        """
+        Remove the sprite a handle refers to, if it is still alive
+        """
+        if self.is_alive(handle):
+            self._swap_remove(self._rows[handle & HANDLE_ID_MASK])
     
+    def remove(self, indices):
+        """
+        Remove the sprites at the given row indices
+        """
+        # going from the last row down, the row swapped in is never one 
+        # that still has to be removed
+        for index in sorted(indices, reverse=True):
+            self._swap_remove(index)
+            
+    def _swap_remove(self, index):
+        """
+        Move the last sprite into the given row and retire the id that 
+        held the row
+        """
+        sprite_id = self._ids[index]
+        last_id = self._ids[-1]
+        self._swap_remove_row(index)
+        self._rows[last_id] = index
+        self._rows[sprite_id] = None
+        self._generations[sprite_id] += 1
+        self._free_ids.append(sprite_id)
+        
+    def _swap_remove_row(self, index):
+        """
+        Move the last row of every column into the given row
+        """
+        for column in self._columns:
+            column[index] = column[-1]
+            column.pop()
+        
     def update(self):
         """
-        Update the position of rocks and missiles
+        Advance every sprite by one tick, wrapping at the screen edges,
+        and remove the sprites whose age reaches the lifespan
         """
-        # update position based on velocity
-        self._pos[0] = (self._pos[0] + self._vel[0]) % WIDTH
-        self._pos[1] = (self._pos[1] + self._vel[1]) % HEIGHT       
+        self._prev_xs[:] = self._xs
+        self._prev_ys[:] = self._ys
+        self._prev_angles[:] = self._angles
+        self._xs[:] = [(pos + vel) % WIDTH for pos, vel in zip(self._xs, self._vxs)]
+        self._ys[:] = [(pos + vel) % HEIGHT for pos, vel in zip(self._ys, self._vys)]
+        self._angles[:] = [ang + ang_vel for ang, ang_vel in zip(self._angles, self._angle_vels)]
+        self._ages[:] = [age + 1 for age in self._ages]
+        self._expire()
         
-        # increment angle by angular velocity
-        self._angle += self._angle_vel
+    def _expire(self):
+        """
+        Move the timing wheel on by one tick and remove the sprites 
+        whose age reaches the lifespan
+        """
+        # only the handles in this tick's bucket can have expired
+        self._tick += 1
+        if self._wheel is not None:
+            bucket = self._wheel[self._tick % len(self._wheel)]
+            for handle in bucket:
+                self.kill(handle)
+            del bucket[:]
+            
+    def draw(self, canvas, alpha = 1.0):
+        """
+        Handler for drawing every sprite, alpha of the way from 
+        their previous to their current state, as one batch of 
+        draws of the same image
+        Returns the number of draw calls issued
+        """
+        image = assets.image(self._asset)
+        draw_image = canvas.draw_image
+        center = self._image_center
+        size = self._image_size
+        (xs, ys, prev_xs, prev_ys, dummy_vxs, dummy_vys, 
+         angles, prev_angles, dummy_angle_vels, ages) = self._column_lists()
+        for index in range(len(xs)):
+            pos = lerp_position([prev_xs[index], prev_ys[index]], 
+                                [xs[index], ys[index]], alpha)
+            angle = prev_angles[index] + (angles[index] - prev_angles[index]) * alpha
+            if image is None:
+                canvas.draw_circle(pos, self._radius, 1, "White")
+            elif not self._animated:
+                draw_image(image, center, size, pos, size, angle)
+            else:
+                # draw explosions
+                draw_image(image, self._frame_centers[ages[index] % 24], 
+                           size, pos, size, angle)
+        return len(xs)
+    
+    def _column_lists(self):
+        """
+        Getter for every column but the ids, in the order they are packed
+        Returns a tuple of lists, the ages as integers
+        """
+        return self._columns[:10]
+    
+    def _wheel_order(self):
+        """
+        List the rows in the order their handles sit in the timing wheel, 
+        which decides the order in which they expire
+        Returns a list of integers
+        """
+        if self._wheel is None:
+            return list(range(len(self)))
+        order = []
+        for offset in range(1, len(self._wheel) + 1):
+            for handle in self._wheel[(self._tick + offset) % len(self._wheel)]:
+                if self.is_alive(handle):
+                    order.append(self._rows[handle & HANDLE_ID_MASK])
+        return order
+    
+    def pack(self, buf):
+        """
+        Append the state of every sprite to the bytearray, as the asset 
+        id, count and tick of the group followed by one packed column 
+        per field and the expiry order of the rows
+        """
+        count = len(self)
+        buf.extend(struct.pack(SNAPSHOT_GROUP, ASSET_IDS.index(self._asset), count, self._tick))
+        column_format = "<%dd" % count
+        columns = self._column_lists()
+        for column in columns[:9]:
+            buf.extend(struct.pack(column_format, *column))
+        buf.extend(struct.pack("<%dI" % count, *columns[9]))
+        buf.extend(struct.pack("<%dI" % count, *self._wheel_order()))
         
-        # remove the sprite when the age is greater than lifespan
-        self._age += 1
-        if self._age >= self._lifespan:
-            return True
-        else:
-            return False        
+    def unpack(self, data, offset):
+        """
+        Replace every sprite with the state packed at the offset
+        Returns the offset just past the state
+        """
+        asset_id, count, tick = struct.unpack_from(SNAPSHOT_GROUP, data, offset)
+        if ASSET_IDS[asset_id] != self._asset:
+            raise ValueError("snapshot holds %s sprites, not %s" % (ASSET_IDS[asset_id], self._asset))
+        offset += struct.calcsize(SNAPSHOT_GROUP)
+        self.clear()
+        self._tick = tick
+        column_format = "<%dd" % count
+        columns = []
+        for dummy in range(9):
+            columns.append(struct.unpack_from(column_format, data, offset))
+            offset += 8 * count
+        ages = struct.unpack_from("<%dI" % count, data, offset)
+        columns.append(ages)
+        offset += 4 * count
+        self._load_columns(columns)
+        handles = [self._allocate_handle(row) for row in range(count)]
+        for row in struct.unpack_from("<%dI" % count, data, offset):
+            self._schedule_expiry(handles[row], ages[row])
+        return offset + 4 * count
     
+    def _load_columns(self, columns):
+        """
+        Fill the empty columns but the ids from sequences in the order 
+        they are packed
+        """
+        for column, values in zip(self._columns, columns):
+            column.extend(values)
+        
     def get_radius(self):
         """
-        Getter for radius
+        Getter for the radius shared by the group
         Returns an integer
         """
         return self._radius
     
-    def get_position(self):
+    def get_position(self, index):
         """
-        Getter for position
-        Returns a list of two integers
+        Getter for the position of one sprite
+        Returns a list of two floats
         """
-        return self._pos
+        return [self._xs[index], self._ys[index]]
     
-    def collide(self, other_object):
+    def get_positions(self):
         """
-        Take another object as an argument, decide whether there is a collision or not
-        Return a Boolean
+        Getter for the position columns
+        Returns a tuple of two lists
         """
-        if dist(self._pos, other_object.get_position()) <= (self._radius + other_object.get_radius()):
-            return True
-        else:
-            return False
+        return (self._xs, self._ys)
     
-class GameGUI:
+    def get_previous_positions(self):
+        """
+        Getter for the position columns before the last update
+        Returns a tuple of two lists
+        """
+        return (self._prev_xs, self._prev_ys)
+    
+    def get_velocities(self):
+        """
+        Getter for the velocity columns
+        Returns a tuple of two lists
+        """
+        return (self._vxs, self._vys)
+    
+    def bucket(self, cell_width, cell_height, cols, rows):
+        """
+        Sort the rows into the cells of a wrap-around grid by position
+        Returns a dictionary from cell key to the list of its rows, 
+        in row order
+        """
+        cells = {}
+        for index in range(len(self._xs)):
+            key = (int(self._xs[index] // cell_width) % cols + 
+                   int(self._ys[index] // cell_height) % rows * cols)
+            if key in cells:
+                cells[key].append(index)
+            else:
+                cells[key] = [index]
+        return cells
+    
+    def swept_hits(self, indices, prev_xs, prev_ys, motion_xs, motion_ys, reach):
+        """
+        Test each sprite in indices against another object, given per 
+        sprite as the object's previous position and its motion during 
+        the last tick, with swept_collide
+        Returns a list of Booleans, one per sprite in indices
+        """
+        hits = []
+        for pair in range(len(indices)):
+            index = indices[pair]
+            prev_delta = wrapped_delta([prev_xs[pair], prev_ys[pair]], 
+                                       [self._prev_xs[index], self._prev_ys[index]])
+            motion = [motion_xs[pair] - self._vxs[index], motion_ys[pair] - self._vys[index]]
+            hits.append(swept_collide(prev_delta, motion, reach))
+        return hits
+    
+    def get_max_speed(self):
+        """
+        Bound the distance any sprite of the group moves in one tick
+        Returns a float
+        """
+        if not self._vxs:
+            return 0.0
+        return max([abs(vel_x) + abs(vel_y) for vel_x, vel_y in zip(self._vxs, self._vys)])
+    
+class NumpySpriteGroup(SpriteGroup):
     """
-    Class to run the game and GUI
+    Class for a group of sprites with the same interface as SpriteGroup, 
+    storing the columns side by side in one NumPy array, so an update is 
+    a single pass over the array.
+    
+    The columns of the array are x, y, angle, age, then the velocities 
+    of those four, the last always 1, then the previous x, y and angle.
     """
-    def __init__(self):
-        # field of gamestate 
-        self._score = 0
-        self._lives = 3
-        self._time = 0
-        self._started = False
-        self._my_ship = Ship([WIDTH / 2, HEIGHT / 2], [0, 0], 0, ship_image, ship_info)
-        self._rock_group = set([])
-        self._missile_group = set([])
-        self._explosion_group = set([])
+    def __init__(self, asset, info):
+        self._bounds = numpy.array([float(WIDTH), float(HEIGHT)])
+        SpriteGroup.__init__(self, asset, info)
         
-        #field of GUI
-        self._frame = simplegui.create_frame("Asteroids", WIDTH, HEIGHT)
-        self._frame.set_keydown_handler(self.keydown)
-        self._frame.set_keyup_handler(self.keyup)
-        self._frame.set_draw_handler(self.draw)
-        self._frame.set_mouseclick_handler(self.click)
-        self._frame.start()
-        self._timer = simplegui.create_timer(1000.0, self.rock_spawner)
-        self._timer.start()
-                
-    def keydown(self, key):
+    def _clear_columns(self):
         """
-        Keydown handler
+        Empty every column
         """
-        if simplegui.KEY_MAP["up"] == key:
-            self._my_ship.thrust_on()
-        elif simplegui.KEY_MAP["left"] == key:
-            self._my_ship.angle_vel_update(-ANGLE_VEL_INC)
-        elif simplegui.KEY_MAP["right"] == key:
-            self._my_ship.angle_vel_update(ANGLE_VEL_INC)
-        elif simplegui.KEY_MAP["space"] == key:
-            a_missile = self._my_ship.shoot()
-            self._missile_group.add(a_missile)
+        # rows are allocated ahead and the array doubles when full
+        self._state = numpy.zeros((16, 11))
+        self._count = 0
+        self._ids = []
         
-    def keyup(self, key):
+    def __len__(self):
+        return self._count
+    
+    def _append_row(self, pos, vel, ang, ang_vel):
         """
-        Keyup handler
+        Append the state of a new sprite to every column but the ids
         """
-        if simplegui.KEY_MAP["up"] == key:
-            self._my_ship.thrust_off()
-        elif simplegui.KEY_MAP["left"] == key:
-            self._my_ship.angle_vel_update(ANGLE_VEL_INC)
-        elif simplegui.KEY_MAP["right"] == key:
-            self._my_ship.angle_vel_update(-ANGLE_VEL_INC)
-                 
-    def click(self, pos):
+        if self._count == len(self._state):
+            state = numpy.zeros((2 * len(self._state), 11))
+            state[:self._count] = self._state
+            self._state = state
+        self._state[self._count] = (pos[0], pos[1], ang, 0, vel[0], vel[1], ang_vel, 1, 
+                                    pos[0], pos[1], ang)
+        self._count += 1
+        
+    def _swap_remove_row(self, index):
         """
-        Mouseclick handlers that reset UI and conditions whether splash image is drawn
+        Move the last row of every column into the given row
         """
-        center = [WIDTH / 2, HEIGHT / 2]
-        size = splash_info.get_size()
-        inwidth = (center[0] - size[0] / 2) < pos[0] < (center[0] + size[0] / 2)
-        inheight = (center[1] - size[1] / 2) < pos[1] < (center[1] + size[1] / 2)
-        if (not self._started) and inwidth and inheight:            
-            self._started = True
-            self._score = 0
-            self._lives = 3           
-            soundtrack.rewind()
-            soundtrack.play()
-            
-    def draw(self, canvas):
+        self._count -= 1
+        self._state[index] = self._state[self._count]
+        self._ids[index] = self._ids[-1]
+        self._ids.pop()
+        
+    def update(self):
         """
-        Draw handler
-        """    
-        # animiate background
-        self._time += 1
-        wtime = (self._time / 4) % WIDTH
-        center = debris_info.get_center()
-        size = debris_info.get_size()
-        canvas.draw_image(nebula_image, nebula_info.get_center(), nebula_info.get_size(), 
-                          [WIDTH / 2, HEIGHT / 2], [WIDTH, HEIGHT])
-        canvas.draw_image(debris_image, center, size, (wtime - WIDTH / 2, HEIGHT / 2), (WIDTH, HEIGHT))
-        canvas.draw_image(debris_image, center, size, (wtime + WIDTH / 2, HEIGHT / 2), (WIDTH, HEIGHT))
-
-        # draw UI
-        canvas.draw_text("Lives", [50, 50], 22, "White")
-        canvas.draw_text("Score", [680, 50], 22, "White")
-        canvas.draw_text(str(self._lives), [50, 80], 22, "White")
-        canvas.draw_text(str(self._score), [680, 80], 22, "White")
+        Advance every sprite by one tick, wrapping at the screen edges,
+        and remove the sprites whose age reaches the lifespan
+        """
+        state = self._state[:self._count]
+        state[:, 8:11] = state[:, 0:3]
+        state[:, 0:4] += state[:, 4:8]
+        state[:, 0:2] %= self._bounds
+        self._expire()
+        
+    def _column_lists(self):
+        """
+        Getter for every column but the ids, in the order they are packed
+        Returns a tuple of lists, the ages as integers
+        """
+        state = self._state[:self._count]
+        columns = [state[:, column].tolist() for column in (0, 1, 8, 9, 4, 5, 2, 10, 6)]
+        columns.append(state[:, 3].astype(int).tolist())
+        return tuple(columns)
     
-        # draw ship and sprites
-        self._my_ship.draw(canvas)
-        process_sprite_group(self._rock_group, canvas)
-        process_sprite_group(self._missile_group, canvas)
-        process_sprite_group(self._explosion_group, canvas)
+    def _load_columns(self, columns):
+        """
+        Fill the empty columns but the ids from sequences in the order 
+        they are packed
+        """
+        count = len(columns[0])
+        self._state = numpy.zeros((max(16, count), 11))
+        for column, values in zip((0, 1, 8, 9, 4, 5, 2, 10, 6, 3), columns):
+            self._state[:count, column] = values
+        self._state[:count, 7] = 1
+        self._count = count
+        
+    def get_position(self, index):
+        """
+        Getter for the position of one sprite
+        Returns a list of two floats
+        """
+        return self._state[index, 0:2].tolist()
     
-        # update ship 
-        self._my_ship.update()
+    def get_positions(self):
+        """
+        Getter for the position columns
+        Returns a tuple of two lists
+        """
+        state = self._state[:self._count]
+        return (state[:, 0].tolist(), state[:, 1].tolist())
     
-        # draw splash screen if not started
-        if not self._started:
-            canvas.draw_image(splash_image, splash_info.get_center(), 
-                              splash_info.get_size(), [WIDTH / 2, HEIGHT / 2], 
-                              splash_info.get_size())
-
-        # midify score and lives                    
-        if self.group_collide(self._rock_group, self._my_ship):
-            self._lives -= 1    
-        self._score += self.group_group_collide(self._rock_group, self._missile_group)
+    def get_previous_positions(self):
+        """
+        Getter for the position columns before the last update
+        Returns a tuple of two lists
+        """
+        state = self._state[:self._count]
+        return (state[:, 8].tolist(), state[:, 9].tolist())
     
-        # game over
-        if self._lives == 0:
-            self._started = False
-            self._rock_group = set([])
-            
-    def rock_spawner(self):
+    def get_velocities(self):
         """
-        Timer handler that spawns rocks
-        """    
-        rock_pos = [random.randrange(WIDTH), random.randrange(HEIGHT)]
-        rock_vel = [random.choice([ROCK_VEL, -ROCK_VEL])*random.random(), 
-                    random.choice([ROCK_VEL, -ROCK_VEL])*random.random()]
-        rock_ang = random.random()* math.pi * 2
-        rock_ang_vel = random.choice([1, -1]) * random.random() * 0.1
-    
-        # varying the rock velocity based on the score as the game progresses 
-        if self._score > 10:   
-            rock_vel[0] *= (self._score / 10)
-            rock_vel[1] *= (self._score / 10)
-        
-        # make sure rocks are some distance away from the ship
-        if dist(rock_pos, self._my_ship.get_position()) >= 80:        
-            # limit the total number of rocks
-            if len(self._rock_group) < MAX_ROCK_NUM and self._started:  
-                a_rock = Sprite(rock_pos, rock_vel, rock_ang, rock_ang_vel, asteroid_image, asteroid_info)
-                self._rock_group.add(a_rock)
+        Getter for the velocity columns
+        Returns a tuple of two lists
+        """
+        state = self._state[:self._count]
+        return (state[:, 4].tolist(), state[:, 5].tolist())
     
-    def group_collide(self, group, other_object):
+    def bucket(self, cell_width, cell_height, cols, rows):
         """
-        Check the collisions between other_object and elements in the group
-        Return a Boolean
+        Sort the rows into the cells of a wrap-around grid by position
+        Returns a dictionary from cell key to the list of its rows, 
+        in row order
         """
-        collided = False
-        for thing in set(group):
-            if thing.collide(other_object):
-                # create a new explosion if collided
-                new_explosion = Sprite(thing.get_position(), [0,0], 0, 0, explosion_image, explosion_info, explosion_sound)
-                self._explosion_group.add(new_explosion)            
-                group.remove(thing)
-                collided = True            
-        return collided    
-
-    def group_group_collide(self, group1, group2):
+        if self._count == 0:
+            return {}
+        state = self._state[:self._count]
+        keys = ((state[:, 0] // cell_width).astype(int) % cols + 
+                (state[:, 1] // cell_height).astype(int) % rows * cols)
+        # a stable sort keeps the rows of each cell in row order
+        order = numpy.argsort(keys, kind = "mergesort")
+        sorted_keys = keys[order]
+        starts = [0] + (numpy.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1).tolist()
+        ends = starts[1:] + [self._count]
+        order = order.tolist()
+        cells = {}
+        for key, start, end in zip(sorted_keys[starts].tolist(), starts, ends):
+            cells[key] = order[start:end]
+        return cells
+    
+    def swept_hits(self, indices, prev_xs, prev_ys, motion_xs, motion_ys, reach):
         """
-        Check the collisions between two groups and remove the element
-        Return an integer which represents the number of elements in first group 
-        that collide with the second group 
+        Test each sprite in indices against another object, given per 
+        sprite as the object's previous position and its motion during 
+        the last tick, with the arithmetic of swept_collide on arrays
+        Returns a list of Booleans, one per sprite in indices
         """
-        collide_number = 0
-        for item in set(group1):
-            if self.group_collide(group2, item):
-                group1.remove(item)
-                collide_number += 1
-        return collide_number
-
+        if not indices:
+            return []
+        rows = self._state[indices]
+        delta_x = (numpy.array(prev_xs) - rows[:, 8]) % WIDTH
+        delta_y = (numpy.array(prev_ys) - rows[:, 9]) % HEIGHT
+        delta_x[delta_x > WIDTH / 2.0] -= WIDTH
+        delta_y[delta_y > HEIGHT / 2.0] -= HEIGHT
+        motion_x = numpy.array(motion_xs) - rows[:, 4]
+        motion_y = numpy.array(motion_ys) - rows[:, 5]
+        length_sq = motion_x ** 2 + motion_y ** 2
+        moving = length_sq > 0
+        # fraction of the tick at which the two objects are closest
+        fraction = numpy.zeros(len(indices))
+        fraction[moving] = (-(delta_x[moving] * motion_x[moving] + delta_y[moving] * motion_y[moving]) / 
+                            length_sq[moving])
+        fraction = numpy.clip(fraction, 0.0, 1.0)
+        closest_x = delta_x + motion_x * fraction
+        closest_y = delta_y + motion_y * fraction
+        return (closest_x ** 2 + closest_y ** 2 <= reach ** 2).tolist()
+    
+    def get_max_speed(self):
+        """
+        Bound the distance any sprite of the group moves in one tick
+        Returns a float
+        """
+        if self._count == 0:
+            return 0.0
+        state = self._state[:self._count]
+        return float((numpy.abs(state[:, 4]) + numpy.abs(state[:, 5])).max())
+    
+class SpatialHash:
+    """
+    Class for a uniform grid over the wrap-around screen, used as the 
+    broad phase of collision detection
+    """
+    def __init__(self, cell_size):
+        self._cols = max(1, int(WIDTH // cell_size))
+        self._rows = max(1, int(HEIGHT // cell_size))
+        self._cell_width = float(WIDTH) / self._cols
+        self._cell_height = float(HEIGHT) / self._rows
+        self._cells = {}
+        self._max_radius = 0
+        
+    def clear(self):
+        """
+        Remove all items from the grid
+        """
+        self._cells = {}
+        self._max_radius = 0
+        
+    def rebuild(self, group):
+        """
+        Clear the grid and insert the index of every sprite in the group
+        """
+        self.clear()
+        self._cells = group.bucket(self._cell_width, self._cell_height, self._cols, self._rows)
+        if self._cells:
+            self._max_radius = group.get_radius()
+            
+    def insert(self, item, pos_x, pos_y, radius):
+        """
+        Insert an item into the cell containing its center
+        """
+        key = (int(pos_x // self._cell_width) % self._cols + 
+               int(pos_y // self._cell_height) % self._rows * self._cols)
+        if key in self._cells:
+            self._cells[key].append(item)
+        else:
+            self._cells[key] = [item]
+        if radius > self._max_radius:
+            self._max_radius = radius
+            
+    def query(self, pos, radius):
+        """
+        Find the items whose cells overlap the circle at pos, 
+        wrapping around the screen edges
+        Returns a list of items
+        """
+        if not self._cells:
+            return []
+        reach = radius + self._max_radius
+        min_col = int((pos[0] - reach) // self._cell_width)
+        max_col = int((pos[0] + reach) // self._cell_width)
+        min_row = int((pos[1] - reach) // self._cell_height)
+        max_row = int((pos[1] + reach) // self._cell_height)
+        # a reach wider than the screen would visit the same cell twice
+        if max_col - min_col + 1 >= self._cols:
+            cols = range(self._cols)
+        else:
+            cols = [col % self._cols for col in range(min_col, max_col + 1)]
+        if max_row - min_row + 1 >= self._rows:
+            rows = range(self._rows)
+        else:
+            rows = [row % self._rows for row in range(min_row, max_row + 1)]
+        found = []
+        for row in rows:
+            for col in cols:
+                key = col + row * self._cols
+                if key in self._cells:
+                    found.extend(self._cells[key])
+        return found
+
+class NullProfiler:
+    """
+    Class standing in for a FrameProfiler when nothing is measured
+    """
+    def lap(self, phase, start):
+        """
+        Do nothing in place of recording a phase
+        Returns 0
+        """
+        return 0
+    
+    def count(self, counter, amount):
+        """
+        Do nothing in place of adding to a counter
+        """
+        pass
+    
+    def gauge(self, counter, value):
+        """
+        Do nothing in place of setting a counter
+        """
+        pass
+    
+class FrameProfiler:
+    """
+    Class for recording the wall time of each phase of a frame, and the 
+    sprite count and collision pair tests, over the last size frames
+    """
+    def __init__(self, size = PROFILE_FRAMES):
+        self._size = size
+        self._names = PROFILE_PHASES + PROFILE_COUNTERS
+        self._samples = dict([(name, [0] * size) for name in self._names])
+        self._current = dict([(name, 0) for name in self._names])
+        self._gauges = set([])
+        self._frames = 0
+        
+    def frames(self):
+        """
+        Getter for the number of frames ended so far
+        Returns an integer
+        """
+        return self._frames
+    
+    def lap(self, phase, start):
+        """
+        Charge the time since start to the phase in the current frame
+        Returns the current clock reading, to start the next phase
+        """
+        now = profile_clock()
+        self._current[phase] += now - start
+        return now
+    
+    def count(self, counter, amount):
+        """
+        Add to a counter in the current frame
+        """
+        self._current[counter] += amount
+        
+    def gauge(self, counter, value):
+        """
+        Set a counter that keeps its value until it is set again
+        """
+        self._current[counter] = value
+        self._gauges.add(counter)
+        
+    def end_frame(self):
+        """
+        Store the current frame into the ring buffers and start a new one
+        """
+        slot = self._frames % self._size
+        for name in self._names:
+            self._samples[name][slot] = self._current[name]
+            if name not in self._gauges:
+                self._current[name] = 0
+        self._frames += 1
+        
+    def _recorded(self, name):
+        """
+        Collect the samples of name from oldest to newest
+        Returns a list
+        """
+        samples = self._samples[name]
+        if self._frames <= self._size:
+            return samples[:self._frames]
+        slot = self._frames % self._size
+        return samples[slot:] + samples[:slot]
+    
+    def percentiles(self, name):
+        """
+        Compute the rolling p50, p95 and p99 of a phase or counter
+        Returns a tuple of three numbers
+        """
+        values = sorted(self._recorded(name))
+        if not values:
+            return (0, 0, 0)
+        return tuple([values[min(len(values) - 1, int(len(values) * rank))] 
+                      for rank in (0.5, 0.95, 0.99)])
+    
+    def summary(self):
+        """
+        Compute the percentiles of every phase and counter
+        Returns a dictionary from name to a tuple of three numbers
+        """
+        return dict([(name, self.percentiles(name)) for name in self._names])
+    
+    def dump(self, path):
+        """
+        Write the recorded frames, oldest first, as comma separated values 
+        with one column per phase in seconds and per counter
+        """
+        columns = [self._recorded(name) for name in self._names]
+        with open(path, "w") as dump_file:
+            dump_file.write(",".join(self._names) + "\n")
+            for row in zip(*columns):
+                dump_file.write(",".join([repr(value) for value in row]) + "\n")
+                
+class GameRandom:
+    """
+    Class for a seeded xorshift random number generator, which gives the 
+    same sequence on every Python version and keeps its whole state in 
+    one integer
+    """
+    def __init__(self, seed):
+        self.setstate(seed)
+        
+    def getstate(self):
+        """
+        Getter for the generator state
+        Returns an integer
+        """
+        return self._state
+    
+    def setstate(self, state):
+        """
+        Setter for the generator state; any integer is accepted
+        """
+        # xorshift never leaves the all-zero state
+        self._state = (state & 0xFFFFFFFF) or 0x9E3779B9
+        
+    def next_int(self):
+        """
+        Advance the generator
+        Returns an integer in [0, 2 ** 32)
+        """
+        state = self._state
+        state ^= (state << 13) & 0xFFFFFFFF
+        state ^= state >> 17
+        state ^= (state << 5) & 0xFFFFFFFF
+        self._state = state
+        return state
+    
+    def random(self):
+        """
+        Returns a float in [0, 1)
+        """
+        return self.next_int() / 4294967296.0
+    
+    def randrange(self, stop):
+        """
+        Returns an integer in [0, stop)
+        """
+        return int(self.random() * stop)
+    
+    def choice(self, seq):
+        """
+        Returns a random element of the non-empty sequence
+        """
+        return seq[self.randrange(len(seq))]
+
+def write_varint(buf, value):
+    """
+    Append a non-negative integer to the bytearray, seven bits per byte
+    """
+    while value >= 0x80:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+    
+def read_varint(data, offset):
+    """
+    Read an integer written by write_varint from the bytearray
+    Returns the integer and the offset just past it
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+        
+class SessionRecorder:
+    """
+    Class for logging the inputs of every tick of a RiceRocksWorld, plus 
+    the score and lives at regular checkpoints, so that the session can 
+    be replayed exactly from the seed of the world
+    """
+    def __init__(self, seed):
+        self._seed = seed
+        self._runs = []
+        self._checkpoints = []
+        self._ticks = 0
+        
+    def record(self, inputs, world):
+        """
+        Log the inputs of one tick, after the world has run it
+        """
+        if self._runs and self._runs[-1][0] == inputs:
+            self._runs[-1][1] += 1
+        else:
+            self._runs.append([inputs, 1])
+        self._ticks += 1
+        if self._ticks % REPLAY_CHECKPOINT_INTERVAL == 0:
+            self._checkpoints.append((self._ticks, world.get_score(), world.get_lives()))
+            
+    def to_bytes(self):
+        """
+        Encode the log as the magic, the seed, the runs of identical 
+        inputs and the checkpoints, all as varints after the magic
+        Returns a bytearray
+        """
+        buf = bytearray([ord(char) for char in REPLAY_MAGIC])
+        write_varint(buf, self._seed)
+        write_varint(buf, len(self._runs))
+        for inputs, count in self._runs:
+            write_varint(buf, count)
+            buf.append(inputs)
+        write_varint(buf, len(self._checkpoints))
+        for tick, score, lives in self._checkpoints:
+            write_varint(buf, tick)
+            write_varint(buf, score)
+            write_varint(buf, lives)
+        return buf
+    
+def replay_session(log):
+    """
+    Run a session logged by SessionRecorder without a GUI as fast as 
+    possible, checking the score and lives at every checkpoint
+    Returns the RiceRocksWorld at the end of the session
+    """
+    data = bytearray(log)
+    if data[:len(REPLAY_MAGIC)] != bytearray([ord(char) for char in REPLAY_MAGIC]):
+        raise ValueError("not a RiceRocks session log")
+    offset = len(REPLAY_MAGIC)
+    seed, offset = read_varint(data, offset)
+    run_count, offset = read_varint(data, offset)
+    runs = []
+    for dummy in range(run_count):
+        count, offset = read_varint(data, offset)
+        runs.append((data[offset], count))
+        offset += 1
+    checkpoint_count, offset = read_varint(data, offset)
+    checkpoints = []
+    for dummy in range(checkpoint_count):
+        tick, offset = read_varint(data, offset)
+        score, offset = read_varint(data, offset)
+        lives, offset = read_varint(data, offset)
+        checkpoints.append((tick, score, lives))
+    
+    world = RiceRocksWorld(seed)
+    next_checkpoint = 0
+    for inputs, count in runs:
+        for dummy in range(count):
+            world.tick(inputs)
+            world.pop_sound_events()
+            if (next_checkpoint < len(checkpoints) and 
+                    checkpoints[next_checkpoint][0] == world.get_time()):
+                tick, score, lives = checkpoints[next_checkpoint]
+                if (world.get_score(), world.get_lives()) != (score, lives):
+                    raise AssertionError("replay diverged at tick %d: score %d lives %d, "
+                                         "recorded score %d lives %d" % 
+                                         (tick, world.get_score(), world.get_lives(), score, lives))
+                next_checkpoint += 1
+    return world
+
+class WaveSpawner:
+    """
+    Class for deciding when rocks spawn, how many and where.
+    
+    Every interval ticks a wave of size rocks spawns, growing by growth 
+    rocks per wave and capped at max_rocks rocks on screen (None for no 
+    cap). Rocks are placed anywhere ("uniform"), along the screen edges 
+    ("edges") or in a ring around the ship ("ring"), and their speed is 
+    scaled by speed.
+    """
+    def __init__(self, interval = ROCK_SPAWN_INTERVAL, size = 1, max_rocks = MAX_ROCK_NUM, 
+                 placement = "uniform", speed = 1.0, growth = 0):
+        if placement not in ("uniform", "edges", "ring"):
+            raise ValueError("unknown placement " + repr(placement))
+        self._interval = interval
+        self._size = size
+        self._max_rocks = max_rocks
+        self._placement = placement
+        self._speed = speed
+        self._growth = growth
+        
+    def wave_size(self, tick, rock_count):
+        """
+        Decide how many rocks spawn at the tick
+        Returns an integer
+        """
+        if tick % self._interval != 0:
+            return 0
+        size = self._size + self._growth * (tick // self._interval - 1)
+        if self._max_rocks is not None:
+            size = min(size, self._max_rocks - rock_count)
+        return max(0, size)
+    
+    def place(self, rng, ship_pos):
+        """
+        Pick a position for a new rock
+        Returns a list of two numbers
+        """
+        if self._placement == "uniform":
+            return [rng.randrange(WIDTH), rng.randrange(HEIGHT)]
+        elif self._placement == "edges":
+            along = rng.random()
+            if rng.random() < 0.5:
+                return [along * WIDTH, rng.choice([0, HEIGHT - 1])]
+            return [rng.choice([0, WIDTH - 1]), along * HEIGHT]
+        else:
+            ang = rng.random() * math.pi * 2
+            radius = SAFE_SPAWN_DISTANCE + rng.random() * (HEIGHT / 2 - SAFE_SPAWN_DISTANCE)
+            return [(ship_pos[0] + math.cos(ang) * radius) % WIDTH, 
+                    (ship_pos[1] + math.sin(ang) * radius) % HEIGHT]
+        
+    def get_speed(self):
+        """
+        Getter for the speed scale of new rocks
+        Returns a float
+        """
+        return self._speed
+    
+class RiceRocksWorld:
+    """
+    Class for the game state, advanced in fixed timesteps without a canvas;
+    the same seed and inputs always give the same game. Sprites are kept 
+    in groups of group_class; NumpySpriteGroup only pays off with 
+    hundreds of rocks, so the lists of SpriteGroup are the default
+    """
+    def __init__(self, seed = None, group_class = None):
+        if seed is None:
+            seed = int(time.time() * 1000)
+        # GameRandom only uses the low 32 bits, which is all snapshots 
+        # and session logs store
+        seed &= 0xFFFFFFFF
+        self._seed = seed
+        self._random = GameRandom(seed)
+        self._recorder = None
+        self._score = 0
+        self._lives = 3
+        self._time = 0
+        self._started = False
+        self._accumulator = 0.0
+        self._my_ship = Ship([WIDTH / 2, HEIGHT / 2], [0, 0], 0, "ship", ship_info)
+        if group_class is None:
+            group_class = SpriteGroup
+        self._rock_group = group_class("asteroid", asteroid_info)
+        self._missile_group = group_class("missile", missile_info)
+        self._explosion_group = group_class("explosion", explosion_info)
+        self._rock_hash = SpatialHash(COLLISION_CELL_SIZE)
+        self._sound_events = []
+        self._profiler = NullProfiler()
+        self._spawner = WaveSpawner()
+        
+    def set_profiler(self, profiler):
+        """
+        Record the time of each phase of a tick into the profiler
+        """
+        self._profiler = profiler
+        
+    def set_spawner(self, spawner):
+        """
+        Let the WaveSpawner decide when rocks spawn from now on
+        """
+        self._spawner = spawner
+        
+    def set_lives(self, lives):
+        """
+        Setter for lives
+        """
+        self._lives = lives
+        
+    def set_recorder(self, recorder):
+        """
+        Log the inputs of every tick into the SessionRecorder, which 
+        must be attached before the first tick to replay the session
+        """
+        self._recorder = recorder
+        
+    def snapshot(self):
+        """
+        Pack the whole game state, including the generator state, into a 
+        fixed-layout buffer that refers to images by asset id; sounds, 
+        the profiler and the recorder are not part of it
+        Returns a bytearray
+        """
+        buf = bytearray(struct.pack(SNAPSHOT_HEADER, SNAPSHOT_MAGIC.encode("ascii"), 
+                                    self._seed, self._random.getstate(), self._time, 
+                                    self._score, self._lives, self._started, 
+                                    self._accumulator))
+        self._my_ship.pack(buf)
+        for group in self.get_groups():
+            group.pack(buf)
+        return buf
+    
+    def restore(self, data):
+        """
+        Replace the game state with a snapshot, after which the world 
+        runs exactly as it did from the moment the snapshot was taken
+        """
+        (magic, self._seed, rng_state, self._time, self._score, self._lives, 
+         started, self._accumulator) = struct.unpack_from(SNAPSHOT_HEADER, data, 0)
+        if magic != SNAPSHOT_MAGIC.encode("ascii"):
+            raise ValueError("not a RiceRocks snapshot")
+        self._random.setstate(rng_state)
+        self._started = bool(started)
+        offset = self._my_ship.unpack(data, struct.calcsize(SNAPSHOT_HEADER))
+        for group in self.get_groups():
+            offset = group.unpack(data, offset)
+            
+    def get_seed(self):
+        """
+        Getter for the seed of the world
+        Returns an integer
+        """
+        return self._seed
+        
+    def start(self):
+        """
+        Start a new game with a fresh score and lives
+        """
+        self._started = True
+        self._score = 0
+        self._lives = 3
+        
+    def step(self, dt, inputs):
+        """
+        Add dt seconds to the accumulator and run as many fixed ticks 
+        as it holds, all with the same inputs bitmask; INPUT_FIRE 
+        and INPUT_START only apply to the first of them
+        Returns the number of ticks run
+        """
+        self._accumulator += dt
+        ticks = 0
+        while self._accumulator >= FIXED_DT:
+            self.tick(inputs)
+            inputs &= ~(INPUT_FIRE | INPUT_START)
+            self._accumulator -= FIXED_DT
+            ticks += 1
+        return ticks
+    
+    def tick(self, inputs):
+        """
+        Advance the game state by exactly one fixed timestep
+        """
+        profiler = self._profiler
+        mark = profile_clock()
+        self._time += 1
+        if inputs & INPUT_START and not self._started:
+            self.start()
+        
+        # apply the controls
+        if inputs & INPUT_THRUST:
+            self._my_ship.thrust_on()
+        else:
+            self._my_ship.thrust_off()
+        angle_vel = 0
+        if inputs & INPUT_LEFT:
+            angle_vel -= ANGLE_VEL_INC
+        if inputs & INPUT_RIGHT:
+            angle_vel += ANGLE_VEL_INC
+        self._my_ship.set_angle_vel(angle_vel)
+        if inputs & INPUT_FIRE:
+            missile_pos, missile_vel = self._my_ship.shoot()
+            self._missile_group.add(missile_pos, missile_vel, 0, 0)
+            self._sound_events.append("missile")
+        
+        # spawn the waves of rocks
+        wave_size = self._spawner.wave_size(self._time, len(self._rock_group))
+        if wave_size:
+            self.rock_spawner(wave_size)
+        mark = profiler.lap("spawn", mark)
+            
+        # update ship and sprites
+        self._rock_group.update()
+        self._missile_group.update()
+        self._explosion_group.update()
+        mark = profiler.lap("sprites", mark)
+        self._my_ship.update()
+        mark = profiler.lap("ship", mark)
+        
+        # midify score and lives, with one broad phase over the rocks 
+        # for both tests unless the ship destroyed some of them
+        self._rock_hash.rebuild(self._rock_group)
+        if self.group_collide(self._rock_group, self._my_ship):
+            self._lives -= 1    
+            self._rock_hash.rebuild(self._rock_group)
+        self._score += self.group_group_collide(self._rock_group, self._missile_group)
+        profiler.lap("collide", mark)
+        profiler.gauge("sprite_count", len(self._rock_group) + len(self._missile_group) + 
+                       len(self._explosion_group))
+    
+        # game over
+        if self._lives == 0:
+            self._started = False
+            self._rock_group.clear()
+            
+        if self._recorder is not None:
+            self._recorder.record(inputs, self)
+            
+    def rock_spawner(self, count = 1):
+        """
+        Spawn count rocks where the spawner places them, away from the ship
+        """    
+        if not self._started:
+            return
+        rng = self._random
+        ship_pos = self._my_ship.get_position()
+        speed = self._spawner.get_speed()
+        for dummy in range(count):
+            # make sure rocks are some distance away from the ship
+            for dummy_attempt in range(SPAWN_ATTEMPTS):
+                rock_pos = self._spawner.place(rng, ship_pos)
+                if dist(rock_pos, ship_pos) >= SAFE_SPAWN_DISTANCE:
+                    break
+            else:
+                continue
+            rock_vel = [rng.choice([ROCK_VEL, -ROCK_VEL])*rng.random()*speed, 
+                        rng.choice([ROCK_VEL, -ROCK_VEL])*rng.random()*speed]
+            rock_ang = rng.random()* math.pi * 2
+            rock_ang_vel = rng.choice([1, -1]) * rng.random() * 0.1
+    
+            # varying the rock velocity based on the score as the game progresses 
+            if self._score > 10:   
+                rock_vel[0] *= (self._score // 10)
+                rock_vel[1] *= (self._score // 10)
+            self._rock_group.add(rock_pos, rock_vel, rock_ang, rock_ang_vel)
+    
+    def group_collide(self, group, other_object):
+        """
+        Check the collisions between other_object and elements in the group
+        over the whole of the last tick; the rock hash must hold the group
+        Return a Boolean
+        """
+        other_prev = other_object.get_previous_position()
+        other_motion = wrapped_delta(other_object.get_position(), other_prev)
+        reach = group.get_radius() + other_object.get_radius()
+        # only the elements sharing a nearby cell are tested, widened by 
+        # how far either side can have moved during the tick, in row order
+        travel = abs(other_motion[0]) + abs(other_motion[1]) + group.get_max_speed()
+        candidates = sorted(self._rock_hash.query(other_object.get_position(), 
+                                                  other_object.get_radius() + travel))
+        count = len(candidates)
+        hits = group.swept_hits(candidates, [other_prev[0]] * count, [other_prev[1]] * count, 
+                                [other_motion[0]] * count, [other_motion[1]] * count, reach)
+        collided = []
+        self._profiler.count("pair_tests", count)
+        for index, hit in zip(candidates, hits):
+            if hit:
+                # create a new explosion if collided
+                self._explosion_group.add(group.get_position(index), [0, 0], 0, 0)
+                self._sound_events.append("explosion")
+                collided.append(index)
+        group.remove(collided)
+        return len(collided) > 0
+
+    def group_group_collide(self, group1, group2):
+        """
+        Check the collisions between two groups over the whole of the last 
+        tick and remove the element; the rock hash must hold group1
+        Return an integer which represents the number of elements in first group 
+        that collide with the second group 
+        """
+        # only the elements of group1 sharing a nearby cell are tested,
+        # widened by how far either side can have moved during the tick
+        reach = group1.get_radius() + group2.get_radius()
+        rock_travel = group1.get_max_speed()
+        xs2, ys2 = group2.get_positions()
+        prev_xs2, prev_ys2 = group2.get_previous_positions()
+        vxs2, vys2 = group2.get_velocities()
+        # every candidate pair is tested in one batch, as the element of 
+        # group1, then the previous position and velocity of the element 
+        # of group2, whose row is kept alongside
+        indices1, rows2, prev_xs, prev_ys, motion_xs, motion_ys = [], [], [], [], [], []
+        for index2 in range(len(xs2)):
+            travel = abs(vxs2[index2]) + abs(vys2[index2]) + rock_travel
+            for index1 in self._rock_hash.query([xs2[index2], ys2[index2]], 
+                                                group2.get_radius() + travel):
+                indices1.append(index1)
+                rows2.append(index2)
+                prev_xs.append(prev_xs2[index2])
+                prev_ys.append(prev_ys2[index2])
+                motion_xs.append(vxs2[index2])
+                motion_ys.append(vys2[index2])
+        hits = group1.swept_hits(indices1, prev_xs, prev_ys, motion_xs, motion_ys, reach)
+        destroyed = set([])
+        spent = []
+        for pair in range(len(hits)):
+            index2 = rows2[pair]
+            # each element of group2 stops at the first element it hits
+            if hits[pair] and (not spent or spent[-1] != index2):
+                # create a new explosion if collided
+                self._explosion_group.add([xs2[index2], ys2[index2]], [0, 0], 0, 0)
+                self._sound_events.append("explosion")
+                spent.append(index2)
+                destroyed.add(indices1[pair])
+        group1.remove(destroyed)
+        group2.remove(spent)
+        self._profiler.count("pair_tests", len(hits))
+        return len(destroyed)
+    
+    def pop_sound_events(self):
+        """
+        Take the names of the sounds triggered since the last call
+        Returns a list of strings
+        """
+        events = self._sound_events
+        self._sound_events = []
+        return events
+    
+    def get_alpha(self):
+        """
+        Getter for how far the accumulator is into the next tick
+        Returns a float between 0 and 1
+        """
+        return self._accumulator / FIXED_DT
+    
+    def get_score(self):
+        """
+        Getter for score
+        Returns an integer
+        """
+        return self._score
+    
+    def get_lives(self):
+        """
+        Getter for lives
+        Returns an integer
+        """
+        return self._lives
+    
+    def get_time(self):
+        """
+        Getter for the number of ticks run
+        Returns an integer
+        """
+        return self._time
+    
+    def is_started(self):
+        """
+        Getter for whether a game is in progress
+        Returns a Boolean
+        """
+        return self._started
+    
+    def get_ship(self):
+        """
+        Getter for the ship
+        Returns a Ship object
+        """
+        return self._my_ship
+    
+    def get_groups(self):
+        """
+        Getter for the sprite groups in drawing order
+        Returns a tuple of the rock, missile and explosion SpriteGroups
+        """
+        return (self._rock_group, self._missile_group, self._explosion_group)
+    
+def observe(world):
+    """
+    Describe the world for an agent: the ship position, velocity and 
+    angle, then the offset and velocity of the ENV_NEAREST_ROCKS nearest 
+    rocks, nearest first, padded with zeros
+    Returns a list of ENV_OBSERVATION_SIZE floats
+    """
+    ship = world.get_ship()
+    ship_pos = ship.get_position()
+    ship_vel = ship.get_velocity()
+    observation = [ship_pos[0], ship_pos[1], ship_vel[0], ship_vel[1], 
+                   ship.get_angle() % (2 * math.pi)]
+    rocks = world.get_groups()[0]
+    xs, ys = rocks.get_positions()
+    vxs, vys = rocks.get_velocities()
+    nearest = []
+    for index in range(len(xs)):
+        delta = wrapped_delta([xs[index], ys[index]], ship_pos)
+        nearest.append((delta[0] ** 2 + delta[1] ** 2, delta, index))
+    nearest.sort()
+    for dummy, delta, index in nearest[:ENV_NEAREST_ROCKS]:
+        observation.extend([delta[0], delta[1], vxs[index], vys[index]])
+    observation.extend([0.0] * (ENV_OBSERVATION_SIZE - len(observation)))
+    return observation
+
+class RiceRocksBatch:
+    """
+    Class for stepping several RiceRocksWorlds in lockstep in one process, 
+    starting a new game in a world as soon as its game is over
+    """
+    def __init__(self, env_ids, seed, num_envs, frame_skip = 1):
+        self._env_ids = env_ids
+        self._seed = seed
+        self._num_envs = num_envs
+        self._frame_skip = frame_skip
+        self._episodes = [0] * len(env_ids)
+        self._worlds = [None] * len(env_ids)
+        
+    def _new_world(self, slot):
+        """
+        Start the next game of one environment, seeded by its id and 
+        episode so that every game of the batch gets its own seed
+        """
+        seed = self._seed + self._env_ids[slot] + self._episodes[slot] * self._num_envs
+        self._episodes[slot] += 1
+        world = RiceRocksWorld(seed)
+        world.tick(INPUT_START)
+        world.pop_sound_events()
+        self._worlds[slot] = world
+        
+    def reset(self):
+        """
+        Start a new game in every environment
+        Returns the observations packed into an array of floats
+        """
+        observations = array("f")
+        for slot in range(len(self._worlds)):
+            self._new_world(slot)
+            observations.extend(observe(self._worlds[slot]))
+        return observations
+    
+    def step(self, actions):
+        """
+        Apply one inputs bitmask per environment for frame_skip ticks, 
+        firing only in the first of them
+        Returns the observations, rewards and done flags packed into arrays
+        """
+        observations = array("f")
+        rewards = array("f")
+        dones = array("b")
+        for slot in range(len(self._worlds)):
+            world = self._worlds[slot]
+            score = world.get_score()
+            lives = world.get_lives()
+            inputs = actions[slot] & ~INPUT_START
+            for dummy in range(self._frame_skip):
+                world.tick(inputs)
+                inputs &= ~INPUT_FIRE
+            world.pop_sound_events()
+            rewards.append(world.get_score() - score - 
+                           ENV_LIFE_PENALTY * (lives - world.get_lives()))
+            if world.is_started():
+                dones.append(0)
+            else:
+                dones.append(1)
+                self._new_world(slot)
+            observations.extend(observe(self._worlds[slot]))
+        return observations, rewards, dones
+
+def run_env_worker(conn, env_ids, seed, num_envs, frame_skip):
+    """
+    Process target serving reset and step commands for one RiceRocksBatch
+    """
+    batch = RiceRocksBatch(env_ids, seed, num_envs, frame_skip)
+    while True:
+        command, actions = conn.recv()
+        if command == "reset":
+            conn.send(batch.reset())
+        elif command == "step":
+            conn.send(batch.step(actions))
+        else:
+            conn.close()
+            return
+
+class RiceRocksVecEnv:
+    """
+    Class for running num_envs independent RiceRocks games across a pool 
+    of worker processes, with a reset/step interface over all of them.
+    
+    Observations come back as one array of num_envs * ENV_OBSERVATION_SIZE 
+    floats, rewards as an array of floats and done flags as an array of 
+    bytes, all in environment order. Without multiprocessing, or with 
+    num_workers set to 0, the games run in this process.
+    """
+    def __init__(self, num_envs, num_workers = None, seed = 0, frame_skip = 1):
+        self._num_envs = num_envs
+        if multiprocessing is None:
+            num_workers = 0
+        elif num_workers is None:
+            num_workers = multiprocessing.cpu_count()
+        num_workers = min(num_workers, num_envs)
+        self._local = None
+        self._conns = []
+        self._workers = []
+        self._slices = []
+        if num_workers == 0:
+            self._local = RiceRocksBatch(list(range(num_envs)), seed, num_envs, frame_skip)
+            return
+        for worker_index in range(num_workers):
+            start = num_envs * worker_index // num_workers
+            stop = num_envs * (worker_index + 1) // num_workers
+            parent_conn, child_conn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target = run_env_worker, 
+                                             args = (child_conn, list(range(start, stop)), 
+                                                     seed, num_envs, frame_skip))
+            worker.daemon = True
+            worker.start()
+            self._conns.append(parent_conn)
+            self._workers.append(worker)
+            self._slices.append((start, stop))
+            
+    def reset(self):
+        """
+        Start a new game in every environment
+        Returns the observations
+        """
+        if self._local is not None:
+            return self._local.reset()
+        for conn in self._conns:
+            conn.send(("reset", None))
+        observations = array("f")
+        for conn in self._conns:
+            observations.extend(conn.recv())
+        return observations
+    
+    def step(self, actions):
+        """
+        Apply one inputs bitmask per environment to every game at once
+        Returns the observations, rewards and done flags
+        """
+        if self._local is not None:
+            return self._local.step(actions)
+        for conn, (start, stop) in zip(self._conns, self._slices):
+            conn.send(("step", list(actions[start:stop])))
+        observations = array("f")
+        rewards = array("f")
+        dones = array("b")
+        for conn in self._conns:
+            part_observations, part_rewards, part_dones = conn.recv()
+            observations.extend(part_observations)
+            rewards.extend(part_rewards)
+            dones.extend(part_dones)
+        return observations, rewards, dones
+    
+    def close(self):
+        """
+        Stop the worker processes
+        """
+        for conn in self._conns:
+            conn.send(("close", None))
+        for worker in self._workers:
+            worker.join()
+        self._conns = []
+        self._workers = []
+
+def run_stress(budget = FIXED_DT, ramp = 250, ticks_per_level = 30, max_levels = 100, seed = 0):
+    """
+    Ramp the number of rocks in a headless world, ramp more per level, 
+    with the ship never running out of lives, until the mean time of a 
+    tick exceeds budget seconds or max_levels levels have run; the ship 
+    does not fire, so the score never speeds the rocks up
+    Returns a list of (rocks, sprites, mean tick seconds) per level, the 
+    last of which is the breaking point
+    """
+    if numpy is not None:
+        world = RiceRocksWorld(seed, NumpySpriteGroup)
+    else:
+        world = RiceRocksWorld(seed)
+    world.set_spawner(WaveSpawner(interval = ticks_per_level, size = ramp, 
+                                  max_rocks = None, placement = "ring"))
+    world.tick(INPUT_START)
+    levels = []
+    while len(levels) < max_levels:
+        start = profile_clock()
+        for dummy in range(ticks_per_level):
+            world.set_lives(3)
+            world.tick(0)
+            world.pop_sound_events()
+        mean = (profile_clock() - start) / ticks_per_level
+        rocks, missiles, explosions = world.get_groups()
+        levels.append((len(rocks), len(rocks) + len(missiles) + len(explosions), mean))
+        if mean > budget:
+            break
+    return levels
+
+class Renderer:
+    """
+    Class for drawing a RiceRocksWorld, keeping everything that does not 
+    change from frame to frame computed once and counting draw calls
+    """
+    def __init__(self):
+        self._nebula_args = (nebula_info.get_center(), nebula_info.get_size(), 
+                             [WIDTH / 2, HEIGHT / 2], [WIDTH, HEIGHT])
+        self._debris_center = debris_info.get_center()
+        self._debris_size = debris_info.get_size()
+        self._screen_size = (WIDTH, HEIGHT)
+        # the debris scrolls a quarter pixel per tick, so its offsets 
+        # repeat every 4 * WIDTH ticks
+        self._debris_offsets = []
+        for tick in range(4 * WIDTH):
+            wtime = (tick / 4.0) % WIDTH
+            self._debris_offsets.append(((wtime - WIDTH / 2, HEIGHT / 2), 
+                                         (wtime + WIDTH / 2, HEIGHT / 2)))
+        self._splash_args = (splash_info.get_center(), splash_info.get_size(), 
+                             [WIDTH / 2, HEIGHT / 2], splash_info.get_size())
+        self._lives = None
+        self._lives_text = ""
+        self._score = None
+        self._score_text = ""
+        self._draw_calls = 0
+        self._frames = 0
+        self._frames_over_budget = 0
+        self._profiler = NullProfiler()
+        
+    def set_profiler(self, profiler):
+        """
+        Record the time spent drawing into the profiler
+        """
+        self._profiler = profiler
+        
+    def render(self, canvas, world, alpha):
+        """
+        Draw the background, HUD, sprites and splash screen
+        """
+        mark = profile_clock()
+        draw_calls = self.draw_background(canvas, world.get_time())
+        mark = self._profiler.lap("background", mark)
+        draw_calls += self.draw_hud(canvas, world.get_lives(), world.get_score())
+        draw_calls += world.get_ship().draw(canvas, alpha)
+        for group in world.get_groups():
+            draw_calls += group.draw(canvas, alpha)
+        if not world.is_started():
+            draw_calls += self.draw_splash(canvas)
+        self._profiler.lap("draw", mark)
+            
+        self._draw_calls = draw_calls
+        self._frames += 1
+        if draw_calls > DRAW_CALL_BUDGET:
+            self._frames_over_budget += 1
+            
+    def draw_background(self, canvas, world_time):
+        """
+        Draw the nebula and the two scrolling debris layers
+        Returns the number of draw calls issued
+        """
+        draw_calls = 0
+        nebula_image = assets.image("nebula")
+        debris_image = assets.image("debris")
+        if nebula_image is not None:
+            canvas.draw_image(nebula_image, *self._nebula_args)
+            draw_calls += 1
+        if debris_image is not None:
+            left, right = self._debris_offsets[world_time % len(self._debris_offsets)]
+            canvas.draw_image(debris_image, self._debris_center, self._debris_size, left, self._screen_size)
+            canvas.draw_image(debris_image, self._debris_center, self._debris_size, right, self._screen_size)
+            draw_calls += 2
+        return draw_calls
+    
+    def draw_hud(self, canvas, lives, score):
+        """
+        Draw lives and score, formatting them only when they change
+        Returns the number of draw calls issued
+        """
+        if lives != self._lives:
+            self._lives = lives
+            self._lives_text = str(lives)
+        if score != self._score:
+            self._score = score
+            self._score_text = str(score)
+        canvas.draw_text("Lives", [50, 50], 22, "White")
+        canvas.draw_text("Score", [680, 50], 22, "White")
+        canvas.draw_text(self._lives_text, [50, 80], 22, "White")
+        canvas.draw_text(self._score_text, [680, 80], 22, "White")
+        return 4
+    
+    def draw_splash(self, canvas):
+        """
+        Draw the splash screen shown before a game starts
+        Returns the number of draw calls issued
+        """
+        splash_image = assets.image("splash")
+        if splash_image is None:
+            canvas.draw_text("Click to start", [WIDTH / 2 - 70, HEIGHT / 2], 22, "White")
+        else:
+            canvas.draw_image(splash_image, *self._splash_args)
+        return 1
+    
+    def get_draw_calls(self):
+        """
+        Getter for the number of draw calls in the last frame
+        Returns an integer
+        """
+        return self._draw_calls
+    
+    def get_frames_over_budget(self):
+        """
+        Getter for how many frames issued more than DRAW_CALL_BUDGET 
+        draw calls, out of how many were rendered
+        Returns a tuple of two integers
+        """
+        return (self._frames_over_budget, self._frames)
+    
+class GameGUI:
+    """
+    Class to run the GUI, rendering a RiceRocksWorld
+    """
+    def __init__(self):
+        self._world = RiceRocksWorld()
+        self._recorder = SessionRecorder(self._world.get_seed())
+        self._world.set_recorder(self._recorder)
+        self._inputs = 0
+        self._last_frame = None
+        self._renderer = Renderer()
+        self._profiler = FrameProfiler()
+        self._world.set_profiler(self._profiler)
+        self._renderer.set_profiler(self._profiler)
+        self._show_profile = False
+        self._profile_lines = []
+        assets.start_prefetch()
+        
+        #field of GUI
+        self._frame = simplegui.create_frame("Asteroids", WIDTH, HEIGHT)
+        self._frame.set_keydown_handler(self.keydown)
+        self._frame.set_keyup_handler(self.keyup)
+        self._frame.set_draw_handler(self.draw)
+        self._frame.set_mouseclick_handler(self.click)
+        self._frame.start()
+                
+    def keydown(self, key):
+        """
+        Keydown handler
+        """
+        if simplegui.KEY_MAP["up"] == key:
+            self._inputs |= INPUT_THRUST
+            assets.sound("thrust").play()
+        elif simplegui.KEY_MAP["left"] == key:
+            self._inputs |= INPUT_LEFT
+        elif simplegui.KEY_MAP["right"] == key:
+            self._inputs |= INPUT_RIGHT
+        elif simplegui.KEY_MAP["space"] == key:
+            self._inputs |= INPUT_FIRE
+        elif simplegui.KEY_MAP["p"] == key:
+            # toggle the profiler overlay
+            self._show_profile = not self._show_profile
+        
+    def keyup(self, key):
+        """
+        Keyup handler
+        """
+        if simplegui.KEY_MAP["up"] == key:
+            self._inputs &= ~INPUT_THRUST
+            assets.sound("thrust").rewind()
+        elif simplegui.KEY_MAP["left"] == key:
+            self._inputs &= ~INPUT_LEFT
+        elif simplegui.KEY_MAP["right"] == key:
+            self._inputs &= ~INPUT_RIGHT
+                 
+    def click(self, pos):
+        """
+        Mouseclick handlers that reset UI and conditions whether splash image is drawn
+        """
+        center = [WIDTH / 2, HEIGHT / 2]
+        size = splash_info.get_size()
+        inwidth = (center[0] - size[0] / 2) < pos[0] < (center[0] + size[0] / 2)
+        inheight = (center[1] - size[1] / 2) < pos[1] < (center[1] + size[1] / 2)
+        if (not self._world.is_started()) and inwidth and inheight:            
+            self._inputs |= INPUT_START
+            assets.sound("soundtrack").rewind()
+            assets.sound("soundtrack").play()
+            
+    def draw(self, canvas):
+        """
+        Draw handler
+        """    
+        # advance the world by the real time since the last frame
+        now = time.time()
+        if self._last_frame is None:
+            elapsed = FIXED_DT
+        else:
+            elapsed = min(now - self._last_frame, MAX_FRAME_TIME)
+        self._last_frame = now
+        if self._world.step(elapsed, self._inputs):
+            # a held space key only fires once
+            self._inputs &= ~(INPUT_FIRE | INPUT_START)
+        for event in self._world.pop_sound_events():
+            assets.sound(event).rewind()
+            assets.sound(event).play()
+        self._renderer.render(canvas, self._world, self._world.get_alpha())
+        self._profiler.end_frame()
+        if self._show_profile:
+            self.draw_profile(canvas)
+            
+    def draw_profile(self, canvas):
+        """
+        Draw the rolling percentiles of the profiler
+        """
+        if self._profiler.frames() % PROFILE_OVERLAY_INTERVAL == 0 or not self._profile_lines:
+            self._profile_lines = ["phase  p50 / p95 / p99 ms"]
+            for phase in PROFILE_PHASES:
+                self._profile_lines.append(phase + "  " + " / ".join(
+                    ["%.2f" % (value * 1000) for value in self._profiler.percentiles(phase)]))
+            for counter in PROFILE_COUNTERS:
+                self._profile_lines.append(counter + "  " + " / ".join(
+                    [str(value) for value in self._profiler.percentiles(counter)]))
+        for line_index in range(len(self._profile_lines)):
+            canvas.draw_text(self._profile_lines[line_index], [20, 130 + 18 * line_index], 14, "Yellow")
+            
+    def save_session(self, path):
+        """
+        Write the log of the session so far to a file, for replay_session
+        """
+        with open(path, "wb") as log_file:
+            log_file.write(self._recorder.to_bytes())
+            
+    def get_profiler(self):
+        """
+        Getter for the profiler, e.g. to dump it to a file
+        Returns a FrameProfiler object
+        """
+        return self._profiler
+
     
 def run_gui():
     """
@@ -468,4 +2338,10 @@ def run_gui():
     """
     gui = GameGUI()
 
-run_gui()
+# Uncomment run_stress() to find how many rocks the simulation 
+# handles within one tick of time per tick, without the GUI.
+
+# print(run_stress()[-1])
+
+if __name__ == "__main__":
+    run_gui()
@@ -13,6 +13,34 @@ import random
 import simplegui
 import codeskulptor
 import math
+import time
+
+# BatchTwentyFortyEight needs NumPy
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+try:
+    # n-tuple weight files and the command line
+    import os
+    import sys
+    import mmap
+    from array import array
+except ImportError:
+    array = None
+try:
+    import threading
+except ImportError:
+    threading = None
+try:
+    import json
+    import argparse
+except ImportError:
+    json = None
 
 # Tile Images
 IMAGENAME = "assets_2048.png"
@@ -32,27 +60,104 @@ OFFSETS = {UP: (1, 0),
            LEFT: (0, 1),
            RIGHT: (0, -1)}
 
+# Bitboard engine for the 4*4 game: the board is one integer holding 
+# 16 four-bit exponents (0 for an empty cell, k for the tile 2**k), 
+# row by row from the lowest bits, each row from its left cell.
+BITBOARD_SIZE = 4
+ROW_MASK = 0xFFFF
+NIBBLE_MASK = 0xF
+MAX_EXPONENT = 15
+
+# N-tuple agent: the 4-cell patterns it weighs, each under all 8 
+# rotations and reflections of the board, and its learning rate.
+NTUPLE_PATTERNS = [(0, 1, 2, 3), (4, 5, 6, 7), (0, 1, 4, 5), 
+                   (1, 2, 5, 6), (5, 6, 9, 10)]
+NTUPLE_TABLE_SIZE = 1 << 16
+NTUPLE_LEARNING_RATE = 0.1
+NTUPLE_WEIGHTS_FILE = "ntuple_2048.f32"
+
+# Monte Carlo player: random games played to the end after each 
+# direction, and how many of them go to a worker at a time.
+MC_ROLLOUTS = 40
+MC_CHUNK_SIZE = 5
+MC_TIME_BUDGET = 0.5
+
+# Statistics harness: games handed to the workers between two 
+# checkpoints and the fields written for every game.
+HARNESS_BLOCK_SIZE = 1000
+HARNESS_FIELDS = ["game", "seed", "score", "max_tile", "moves", "duration"]
+
+# Game records: the magic at the start of every record, how often 
+# a reader keeps a snapshot to scrub from, and the undo depth of the GUI.
+RECORD_MAGIC = "R2K1"
+RECORD_SPAWNED_FOUR = 0x08
+RECORD_NO_SPAWN = 0x10
+RECORD_KEYFRAME_INTERVAL = 256
+UNDO_DEPTH = 1000
+
+# Number of distinct lines whose merge result is remembered.
+MERGE_CACHE_SIZE = 4096
+
+# Expectimax player: how deep and how long it searches, the spawn 
+# probabilities it averages over and the weights of its heuristic.
+AI_TIME_BUDGET = 0.05
+AI_MOVE_INTERVAL = 100
+MAX_SEARCH_DEPTH = 8
+PROBABILITY_CUTOFF = 0.0001
+SPAWN_TWO_PROBABILITY = 0.9
+DEADLINE_CHECK_NODES = 256
+HEURISTIC_LOST_PENALTY = 200000.0
+HEURISTIC_MONOTONICITY_POWER = 4.0
+HEURISTIC_MONOTONICITY_WEIGHT = 47.0
+HEURISTIC_SUM_POWER = 3.5
+HEURISTIC_SUM_WEIGHT = 11.0
+HEURISTIC_MERGE_WEIGHT = 700.0
+HEURISTIC_EMPTY_WEIGHT = 270.0
+
 class GUI:
     """
     Class to run game GUI.
     """
 
-    def __init__(self, game):
+    def __init__(self, game, player = None):
         self._rows = game.get_grid_height()
         self._cols = game.get_grid_width()
         self._frame = simplegui.create_frame('2048',
                         self._cols * TILE_SIZE + 2 * BORDER_SIZE,
                         self._rows * TILE_SIZE + 2 * BORDER_SIZE)
         self._frame.add_button('New Game', self.start)
+        self._frame.add_button('Undo', self.undo)
         self._frame.set_keydown_handler(self.keydown)
         self._frame.set_draw_handler(self.draw)
         self._frame.set_canvas_background("#BCADA1")
+        # The expectimax and n-tuple players can only drive a 4*4 game. 
+        # Without a player given, the expectimax player, whose tables 
+        # take a while to build, is made after the first Auto Play click, 
+        # on a thread of its own where there are threads.
+        self._player = player
+        self._builder = None
+        self._timer = None
+        if self._rows == BITBOARD_SIZE and self._cols == BITBOARD_SIZE:
+            self._timer = simplegui.create_timer(AI_MOVE_INTERVAL, self.ai_move)
+            self._frame.add_button('Auto Play', self.auto_play)
+            self._label = self._frame.add_label('')
         self._frame.start()
         self._game = game
+        self._game.set_undo_depth(UNDO_DEPTH)
         url = codeskulptor.file2url(IMAGENAME)
         self._tiles = simplegui.load_image(url)
         self._directions = {"up": UP, "down": DOWN,
                             "left": LEFT, "right": RIGHT}
+        # Sprite sheet centre of each tile exponent and canvas centre 
+        # of each cell, computed once, and the exponent last seen in 
+        # each cell, updated only for the cells the game reports changed.
+        self._sources = [[HALF_TILE_SIZE + val * TILE_SIZE, HALF_TILE_SIZE] 
+                         for val in range(MAX_EXPONENT + 1)]
+        self._centers = [[col * TILE_SIZE + HALF_TILE_SIZE + BORDER_SIZE,
+                          row * TILE_SIZE + HALF_TILE_SIZE + BORDER_SIZE]
+                         for row in range(self._rows) for col in range(self._cols)]
+        self._exponents = [0] * (self._rows * self._cols)
+        self._tile_size = [TILE_SIZE, TILE_SIZE]
 
     def keydown(self, key):
         """
@@ -63,23 +168,79 @@ class GUI:
                 self._game.move(dirval)
                 break
 
+    def refresh(self):
+        """
+        Update the cached exponents of the cells changed since 
+        the last refresh.
+        """
+        for row, col in self._game.take_dirty_cells():
+            val = exponent_of(self._game.get_tile(row, col))
+            while val >= len(self._sources):
+                self._sources.append([HALF_TILE_SIZE + len(self._sources) * TILE_SIZE, 
+                                      HALF_TILE_SIZE])
+            self._exponents[row * self._cols + col] = val
+
     def draw(self, canvas):
         """
         Draw handler
         """
-        for row in range(self._rows):
-            for col in range(self._cols):
-                tile = self._game.get_tile(row, col)
-                if tile == 0:
-                    val = 0
-                else:
-                    val = int(math.log(tile, 2))
-                canvas.draw_image(self._tiles,
-                    [HALF_TILE_SIZE + val * TILE_SIZE, HALF_TILE_SIZE],
-                    [TILE_SIZE, TILE_SIZE],
-                    [col * TILE_SIZE + HALF_TILE_SIZE + BORDER_SIZE,
-                     row * TILE_SIZE + HALF_TILE_SIZE + BORDER_SIZE],
-                    [TILE_SIZE, TILE_SIZE])
+        # The canvas is cleared before every frame, so each cell is 
+        # drawn again, but straight from the cached positions.
+        self.refresh()
+        tiles = self._tiles
+        sources = self._sources
+        exponents = self._exponents
+        centers = self._centers
+        size = self._tile_size
+        for index in range(len(centers)):
+            canvas.draw_image(tiles, sources[exponents[index]], size, 
+                              centers[index], size)
+
+    def auto_play(self):
+        """
+        Start or stop the AI player.
+        """
+        if self._timer.is_running():
+            self._timer.stop()
+        else:
+            if self._player is None and self._builder is None:
+                self._label.set_text('Thinking...')
+                if threading is not None:
+                    self._builder = threading.Thread(target = self.build_player)
+                    self._builder.daemon = True
+                    self._builder.start()
+            self._timer.start()
+
+    def build_player(self):
+        """
+        Build the expectimax player and its tables.
+        """
+        self._player = ExpectimaxPlayer()
+
+    def ai_move(self):
+        """
+        Timer handler that lets the AI player make one move
+        """
+        if self._player is None:
+            if self._builder is not None:
+                # the player is still being built
+                return
+            # without threads, build it now that the label is shown
+            self.build_player()
+        direction = self._player.best_move(self._game, AI_TIME_BUDGET)
+        if direction is None:
+            self._timer.stop()
+            self._label.set_text('Game over')
+            return
+        self._game.move(direction)
+        self._label.set_text('Score ' + str(self._game.get_score()) + ', ' + 
+                             str(int(self._player.get_nodes_per_second())) + ' nodes/s')
+
+    def undo(self):
+        """
+        Take back the last move.
+        """
+        self._game.undo()
 
     def start(self):
         """
@@ -92,7 +253,7 @@ class TwentyFortyEight:
     Class to run the game logic.
     """
 
-    def __init__(self, grid_height, grid_width):
+    def __init__(self, grid_height, grid_width, seed = None):
         self._grid_height = grid_height
         self._grid_width = grid_width
         self._up_initial_tiles = [(0,col) for col in range(self._grid_width)]
@@ -103,15 +264,61 @@ class TwentyFortyEight:
                                  DOWN: self._down_initial_tiles,
                                  LEFT: self._left_initial_tiles,
                                  RIGHT: self._right_initial_tiles}
+        # Use OFFSETS dictionary to list the squares of every line 
+        # in each direction, starting from its initial tile.
+        self._lines = {}
+        for direction, initial_tiles in self._move_dictionary.items():
+            steps = self._grid_height
+            if direction == RIGHT or direction == LEFT:
+                steps = self._grid_width
+            self._lines[direction] = [[(initial_tile[0] + step * OFFSETS[direction][0], 
+                                        initial_tile[1] + step * OFFSETS[direction][1]) 
+                                       for step in range(steps)] 
+                                      for initial_tile in initial_tiles]
+        # New tiles come from the random module, or from a generator 
+        # of their own when the game is seeded.
+        self._seed = seed
+        if seed is None:
+            self._random = random
+        else:
+            self._random = random.Random(seed)
+        self._score = 0
+        self._last_spawn = None
+        self._recorder = None
+        self._undo_stack = []
+        self._undo_depth = 0
+        # Flat list of (cell, old value) pairs set_tile adds to while 
+        # a move is being recorded for undo, None otherwise.
+        self._changes = None
+        # Squares whose value changed since take_dirty_cells was last 
+        # called, or None until it is first called, so games nobody 
+        # draws keep no record.
+        self._dirty = None
         self.reset()
 
     def reset(self):
         """
         Reset the game so the grid is empty except for two initial tiles.
         """
+        self._score = 0
         self._cells = [[0 for dummy_col in range(self._grid_width)]for dummy_row in range(self._grid_height)]
+        # Index of the empty squares: a list to draw from and the 
+        # position of each square in it, so squares are added and 
+        # swap-removed in constant time by set_tile.
+        self._empty = [(row, col) for row in range(self._grid_height) 
+                       for col in range(self._grid_width)]
+        self._empty_index = dict((square, index) for index, square in enumerate(self._empty))
+        if self._dirty is not None:
+            self._dirty = set(self._empty)
+        # Number of pairs of equal, non-empty neighbouring tiles, kept 
+        # by set_tile so a full grid is known to be stuck at once.
+        self._pairs = 0
+        self._changes = None
         self.new_tile()
         self.new_tile()
+        self._undo_stack = []
+        if self._recorder is not None:
+            self._recorder.start(self)
 
     def __str__(self):
         """
@@ -130,36 +337,69 @@ class TwentyFortyEight:
         Get the width of the board.
         """
         return self._grid_width
+
+    def get_score(self):
+        """
+        Get the sum of all tiles made by merging so far.
+        """
+        return self._score
         
+    def move_score(self, direction):
+        """
+        Return the score a move in the given direction would add, 
+        or None if no tiles would move. The grid is left alone.
+        """
+        cells = self._cells
+        score = None
+        for line in self._lines[direction]:
+            dummy_merged, line_changed, score_delta = merge_line(
+                tuple([cells[row][col] for row, col in line]))
+            if line_changed:
+                score = (score or 0) + score_delta
+        return score
+
     def move(self, direction):
         """
         Move all tiles in the given direction and add
         a new tile if any tiles moved.
+        Returns True if any tiles moved.
+        """        
+        score = self._score
+        if self._undo_depth > 0:
+            self._changes = []
+        if not self.slide(direction):
+            self._changes = None
+            return False
+        self.new_tile()
+        if self._changes is not None:
+            self._undo_stack.append((self.take_changes(), score))
+            if len(self._undo_stack) > self._undo_depth:
+                del self._undo_stack[0]
+        if self._recorder is not None:
+            self._recorder.record(direction, self._last_spawn)
+        return True
+
+    def slide(self, direction):
+        """
+        Move all tiles in the given direction without adding 
+        a new tile.
+        Returns True if any tiles moved.
         """        
-        steps = self._grid_height
         changed = False
-        if direction == RIGHT or direction == LEFT:
-            steps = self._grid_width
-        # Use OFFSETS dictionary to iterate over the entries. 
-        # Retrieve the tile values and store them in a temporary list.
-        for initial_tile in self._move_dictionary[direction]:
-            temporary_list = []    
-            for step in range(steps):                
-                row = initial_tile[0] + step * OFFSETS[direction][0]
-                col = initial_tile[1] + step * OFFSETS[direction][1]
-                val = self.get_tile(row,col)
-                temporary_list.append(val)
-            merged_value = merge(temporary_list)
+        cells = self._cells
+        # Retrieve the tile values of each line and store them in a tuple.
+        for line in self._lines[direction]:
+            temporary_line = tuple([cells[row][col] for row, col in line])
+            merged_value, line_changed, score_delta = merge_line(temporary_line)
+            if not line_changed:
+                continue
             # Store the merged tile values back into the grid.
-            for step in range(steps):
-                row = initial_tile[0] + step * OFFSETS[direction][0]
-                col = initial_tile[1] + step * OFFSETS[direction][1]
-                self.set_tile(row, col, merged_value[step])
-                if merged_value != temporary_list:
-                    changed = True
-
-        if changed:
-            self.new_tile()
+            for step in range(len(line)):
+                if merged_value[step] != temporary_line[step]:
+                    self.set_tile(line[step][0], line[step][1], merged_value[step])
+            self._score += score_delta
+            changed = True
+        return changed
     
     def new_tile(self):
         """
@@ -167,21 +407,51 @@ class TwentyFortyEight:
         The tile should be 2 90% of the time and 4 10% of the time.
         """
         possible_input_num = [2,2,2,2,2,2,2,2,2,4]
-        input_number = random.choice(possible_input_num)
-        non_value_pos = []
-        for row in range(self._grid_height):
-            for col in range(self._grid_width):
-                if self._cells[row][col] == 0:
-                    non_value_pos.append([row,col])
-        if non_value_pos != []:
-            input_pos = random.choice(non_value_pos)
+        input_number = self._random.choice(possible_input_num)
+        self._last_spawn = None
+        if self._empty != []:
+            input_pos = self._random.choice(self._empty)
             self.set_tile(input_pos[0], input_pos[1], input_number)
+            self._last_spawn = (input_pos[0] * self._grid_width + input_pos[1], input_number)
             
     def set_tile(self, row, col, value):
         """
         Set the tile at position row, col to have the given value.
         """
-        self._cells[row][col] = value
+        cells = self._cells
+        old_value = cells[row][col]
+        cells[row][col] = value
+        if old_value != value:
+            if self._dirty is not None:
+                self._dirty.add((row, col))
+            if self._changes is not None:
+                self._changes.append(row * self._grid_width + col)
+                self._changes.append(old_value)
+            neighbours = []
+            if row > 0:
+                neighbours.append(cells[row - 1][col])
+            if row + 1 < self._grid_height:
+                neighbours.append(cells[row + 1][col])
+            if col > 0:
+                neighbours.append(cells[row][col - 1])
+            if col + 1 < self._grid_width:
+                neighbours.append(cells[row][col + 1])
+            for neighbour in neighbours:
+                if neighbour != 0:
+                    if neighbour == old_value:
+                        self._pairs -= 1
+                    elif neighbour == value:
+                        self._pairs += 1
+        if old_value == 0 and value != 0:
+            # swap the last empty square into the place of this one
+            index = self._empty_index.pop((row, col))
+            last = self._empty.pop()
+            if index < len(self._empty):
+                self._empty[index] = last
+                self._empty_index[last] = index
+        elif old_value != 0 and value == 0:
+            self._empty_index[(row, col)] = len(self._empty)
+            self._empty.append((row, col))
 
     def get_tile(self, row, col):
         """
@@ -189,34 +459,1818 @@ class TwentyFortyEight:
         """
         return self._cells[row][col]
 
+    def get_seed(self):
+        """
+        Get the seed of the game, or None if it is not seeded.
+        """
+        return self._seed
+
+    def snapshot(self):
+        """
+        Return an immutable copy of the grid and score: a tuple 
+        of all tiles, row by row, and the score.
+        """
+        tiles = []
+        for row in self._cells:
+            tiles.extend(row)
+        return (tuple(tiles), self._score)
+
+    def restore(self, snapshot):
+        """
+        Put the grid and score back as they were in a snapshot.
+        """
+        tiles, score = snapshot
+        cells = self._cells
+        width = self._grid_width
+        for index in range(len(tiles)):
+            row, col = divmod(index, width)
+            if cells[row][col] != tiles[index]:
+                self.set_tile(row, col, tiles[index])
+        self._score = score
+
+    def take_changes(self):
+        """
+        Stop recording the changes of a move for undo.
+        Returns the (cell, old value) pairs set_tile recorded, packed 
+        in a flat array of ints where the array module is available
+        """
+        changes = self._changes
+        self._changes = None
+        if array is not None:
+            return array("i", changes)
+        return tuple(changes)
+
+    def revert(self, changes):
+        """
+        Put back the old values of the cells changed by a move, 
+        as returned by take_changes, last change first.
+        """
+        width = self._grid_width
+        for index in range(len(changes) - 2, -1, -2):
+            row, col = divmod(changes[index], width)
+            self.set_tile(row, col, changes[index + 1])
+
+    def set_undo_depth(self, depth):
+        """
+        Keep the changes of up to depth earlier moves for undo, 
+        0 to keep none.
+        """
+        self._undo_depth = depth
+        if len(self._undo_stack) > depth:
+            del self._undo_stack[:len(self._undo_stack) - depth]
+
+    def undo(self):
+        """
+        Take back the last move, spawned tile included.
+        Returns True if there was a move to take back.
+        """
+        if self._undo_stack == []:
+            return False
+        changes, score = self._undo_stack.pop()
+        self.revert(changes)
+        self._score = score
+        if self._recorder is not None:
+            self._recorder.undo()
+        return True
+
+    def set_recorder(self, recorder):
+        """
+        Record the game from now on with a GameRecorder, or stop 
+        recording with None. Tiles set with set_tile are not recorded.
+        """
+        self._recorder = recorder
+        if recorder is not None:
+            recorder.start(self)
+
+    def take_dirty_cells(self):
+        """
+        Return the set of (row, col) tuples of the squares whose 
+        value changed since the last call, or since the last reset. 
+        The first call returns every square and starts the record.
+        """
+        dirty = self._dirty
+        if dirty is None:
+            dirty = set([(row, col) for row in range(self._grid_height) 
+                         for col in range(self._grid_width)])
+        self._dirty = set()
+        return dirty
+
+    def get_random(self):
+        """
+        Get the random number generator that places new tiles.
+        """
+        return self._random
+
+    def set_grid(self, tiles, score = 0):
+        """
+        Replace every tile with the values of tiles, a sequence of 
+        rows, and set the score.
+        """
+        for row in range(self._grid_height):
+            for col in range(self._grid_width):
+                self.set_tile(row, col, tiles[row][col])
+        self._score = score
+
+    def get_empty_squares(self):
+        """
+        Return the list of (row, col) tuples of the empty squares, 
+        in no particular order. The list is kept up to date by the 
+        game and should not be modified.
+        """
+        return self._empty
+
+    def is_game_over(self):
+        """
+        Return True if the grid is full and no two neighbouring 
+        tiles can merge.
+        """
+        return self._empty == [] and self._pairs == 0
+
 def merge(line):
     """
     Helper function that merges a single row or column in 2048
     """
+    return list(merge_line(tuple(line))[0])
+
+def merge_line(line):
+    """
+    Helper function that merges a row or column given as a tuple, 
+    remembering the results for recently seen lines
+    Returns a tuple (merged line, whether it changed, merge score)
+    """
+    result = merge_cache.get(line)
+    if result is None:
+        tiles = [num for num in line if num != 0]
+        merged = []
+        score = 0
+        index = 0
+        while index < len(tiles):
+            if index + 1 < len(tiles) and tiles[index] == tiles[index + 1]:
+                merged.append(tiles[index] * 2)
+                score += tiles[index] * 2
+                index += 2
+            else:
+                merged.append(tiles[index])
+                index += 1
+        merged = tuple(merged) + (0,) * (len(line) - len(merged))
+        result = (merged, merged != line, score)
+        merge_cache.put(line, result)
+    return result
+
+class MergeCache:
+    """
+    Class to remember the results of merge_line for the most 
+    recently used lines, up to a fixed number of lines.
+    """
+
+    def __init__(self, capacity = MERGE_CACHE_SIZE):
+        self._capacity = capacity
+        self._entries = {}
+        # Circular doubly linked list of [previous, next, key, value]
+        # links, from the least to the most recently used line.
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key):
+        """
+        Look up a line and mark it as the most recently used
+        Returns the remembered result, or None
+        """
+        link = self._entries.get(key)
+        if link is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        previous, following = link[0], link[1]
+        previous[1] = following
+        following[0] = previous
+        last = self._root[0]
+        last[1] = self._root[0] = link
+        link[0] = last
+        link[1] = self._root
+        return link[3]
+
+    def put(self, key, value):
+        """
+        Remember the result for a line that is not yet remembered, 
+        forgetting the least recently used line if the cache is full.
+        """
+        if len(self._entries) >= self._capacity:
+            oldest = self._root[1]
+            self._root[1] = oldest[1]
+            oldest[1][0] = self._root
+            del self._entries[oldest[2]]
+        last = self._root[0]
+        link = [last, self._root, key, value]
+        last[1] = self._root[0] = self._entries[key] = link
+
+    def clear(self):
+        """
+        Forget every line and reset the counters.
+        """
+        self._entries = {}
+        self._root[:] = [self._root, self._root, None, None]
+        self._hits = 0
+        self._misses = 0
+
+    def get_size(self):
+        """
+        Getter for the number of remembered lines
+        Returns an int
+        """
+        return len(self._entries)
+
+    def get_capacity(self):
+        """
+        Getter for the largest number of remembered lines
+        Returns an int
+        """
+        return self._capacity
+
+    def get_hits(self):
+        """
+        Getter for the number of lookups that found their line
+        Returns an int
+        """
+        return self._hits
+
+    def get_misses(self):
+        """
+        Getter for the number of lookups that did not
+        Returns an int
+        """
+        return self._misses
+
+    def get_hit_rate(self):
+        """
+        Getter for the share of lookups that found their line
+        Returns a float between 0 and 1
+        """
+        lookups = self._hits + self._misses
+        if lookups == 0:
+            return 0.0
+        return float(self._hits) / lookups
+
+merge_cache = MergeCache()
+
+_row_left_table = []
+_row_right_table = []
+_row_left_score_table = []
+_row_right_score_table = []
+
+def build_move_tables():
+    """
+    Precompute the result of moving each of the 65536 possible rows 
+    left and right. Runs once, on first use of the bitboard engine.
+    """
+    if _row_left_table:
+        return
+    for row in range(1 << 16):
+        exponents = [(row >> (4 * col)) & NIBBLE_MASK for col in range(BITBOARD_SIZE)]
+        left, left_score = slide_exponents(exponents)
+        right, right_score = slide_exponents(exponents[::-1])
+        _row_left_table.append(pack_row(left))
+        _row_right_table.append(pack_row(right[::-1]))
+        _row_left_score_table.append(left_score)
+        _row_right_score_table.append(right_score)
+        
+def slide_exponents(exponents):
+    """
+    Helper function that merges a row of exponents to the left, 
+    the same way merge does with tiles
+    Returns the merged exponents and the merge score
+    """
+    tiles = [exponent for exponent in exponents if exponent]
+    result = []
+    score = 0
+    index = 0
+    while index < len(tiles):
+        # two 32768 tiles would not fit in a nibble, so they never merge
+        if (index + 1 < len(tiles) and tiles[index] == tiles[index + 1] 
+                and tiles[index] < MAX_EXPONENT):
+            result.append(tiles[index] + 1)
+            score += 1 << (tiles[index] + 1)
+            index += 2
+        else:
+            result.append(tiles[index])
+            index += 1
+    return result + [0] * (len(exponents) - len(result)), score
+
+def exponent_of(tile):
+    """
+    Helper function that gives k for the tile 2**k and 0 for no tile
+    """
+    exponent = 0
+    while tile > 1:
+        tile >>= 1
+        exponent += 1
+    return exponent
+
+def pack_row(exponents):
+    """
+    Helper function that packs four exponents into a 16-bit row
+    """
+    row = 0
+    for col in range(BITBOARD_SIZE):
+        row |= exponents[col] << (4 * col)
+    return row
+
+def transpose_bitboard(board):
+    """
+    Swap the rows and columns of a bitboard
+    """
+    part1 = board & 0xF0F00F0FF0F00F0F
+    part2 = board & 0x0000F0F00000F0F0
+    part3 = board & 0x0F0F00000F0F0000
+    board = part1 | (part2 << 12) | (part3 >> 12)
+    part1 = board & 0xFF00FF0000FF00FF
+    part2 = board & 0x00FF00FF00000000
+    part3 = board & 0x00000000FF00FF00
+    return part1 | (part2 >> 24) | (part3 << 24)
+
+def bitboard_move(board, direction):
+    """
+    Move all tiles of a bitboard in the given direction
+    Returns the new bitboard, which equals board if nothing moved
+    """
+    if not _row_left_table:
+        build_move_tables()
+    if direction == UP or direction == DOWN:
+        board = transpose_bitboard(board)
+    if direction == LEFT or direction == UP:
+        table = _row_left_table
+    else:
+        table = _row_right_table
+    result = (table[board & ROW_MASK] | 
+              table[(board >> 16) & ROW_MASK] << 16 | 
+              table[(board >> 32) & ROW_MASK] << 32 | 
+              table[(board >> 48) & ROW_MASK] << 48)
+    if direction == UP or direction == DOWN:
+        result = transpose_bitboard(result)
+    return result
+
+def bitboard_move_score(board, direction):
+    """
+    Sum the tiles made by merging when a bitboard moves in the 
+    given direction
+    """
+    if not _row_left_table:
+        build_move_tables()
+    if direction == UP or direction == DOWN:
+        board = transpose_bitboard(board)
+    if direction == LEFT or direction == UP:
+        table = _row_left_score_table
+    else:
+        table = _row_right_score_table
+    return (table[board & ROW_MASK] + table[(board >> 16) & ROW_MASK] + 
+            table[(board >> 32) & ROW_MASK] + table[(board >> 48) & ROW_MASK])
+
+def bitboard_empty_cells(board):
+    """
+    List the empty cells of a bitboard
+    Returns a list of cell indices, row * 4 + col
+    """
+    return [cell for cell in range(BITBOARD_SIZE * BITBOARD_SIZE) 
+            if not (board >> (4 * cell)) & NIBBLE_MASK]
+
+def game_to_bitboard(game):
+    """
+    Pack the tiles of any 4*4 game into a bitboard
+    """
+    if hasattr(game, "get_bitboard"):
+        return game.get_bitboard()
+    if game.get_grid_height() != BITBOARD_SIZE or game.get_grid_width() != BITBOARD_SIZE:
+        raise ValueError("bitboards only hold a 4*4 grid")
+    board = 0
+    for row in range(BITBOARD_SIZE):
+        for col in range(BITBOARD_SIZE):
+            exponent = exponent_of(game.get_tile(row, col))
+            if exponent > MAX_EXPONENT:
+                raise ValueError("bitboards hold tiles up to %d" % (1 << MAX_EXPONENT))
+            board |= exponent << (4 * (row * BITBOARD_SIZE + col))
+    return board
+
+class BitboardTwentyFortyEight(TwentyFortyEight):
+    """
+    Class to run the game logic of the 4*4 game on a bitboard, 
+    with the same interface as TwentyFortyEight.
+    """
+
+    def __init__(self, grid_height = BITBOARD_SIZE, grid_width = BITBOARD_SIZE, seed = None):
+        if grid_height != BITBOARD_SIZE or grid_width != BITBOARD_SIZE:
+            raise ValueError("the bitboard engine only plays on a 4*4 grid")
+        build_move_tables()
+        TwentyFortyEight.__init__(self, grid_height, grid_width, seed)
+
+    def reset(self):
+        """
+        Reset the game so the grid is empty except for two initial tiles.
+        """
+        self._score = 0
+        self._board = 0
+        # board as of the last take_dirty_cells, None to mark every cell
+        self._taken_board = None
+        self._changes = None
+        self.new_tile()
+        self.new_tile()
+        self._undo_stack = []
+        if self._recorder is not None:
+            self._recorder.start(self)
+
+    def __str__(self):
+        """
+        Return a string representation of the grid for debugging.
+        """        
+        return str([[self.get_tile(row, col) for col in range(BITBOARD_SIZE)] 
+                    for row in range(BITBOARD_SIZE)])
+
+    def move_score(self, direction):
+        """
+        Return the score a move in the given direction would add, 
+        or None if no tiles would move. The grid is left alone.
+        """
+        if bitboard_move(self._board, direction) == self._board:
+            return None
+        return bitboard_move_score(self._board, direction)
+
+    def slide(self, direction):
+        """
+        Move all tiles in the given direction without adding 
+        a new tile.
+        Returns True if any tiles moved.
+        """        
+        moved = bitboard_move(self._board, direction)
+        if moved == self._board:
+            return False
+        if self._changes is not None:
+            # the board before the move is all undo needs
+            self._changes.append(self._board)
+        self._score += bitboard_move_score(self._board, direction)
+        self._board = moved
+        return True
+
+    def new_tile(self):
+        """
+        Create a new tile in a randomly selected empty square.  
+        The tile should be 2 90% of the time and 4 10% of the time.
+        """
+        possible_input_num = [1,1,1,1,1,1,1,1,1,2]
+        input_number = self._random.choice(possible_input_num)
+        empty = bitboard_empty_cells(self._board)
+        self._last_spawn = None
+        if empty != []:
+            cell = self._random.choice(empty)
+            self._board |= input_number << (4 * cell)
+            self._last_spawn = (cell, 1 << input_number)
+
+    def snapshot(self):
+        """
+        Return an immutable copy of the grid and score: the 
+        bitboard and the score.
+        """
+        return (self._board, self._score)
+
+    def restore(self, snapshot):
+        """
+        Put the grid and score back as they were in a snapshot.
+        """
+        self._board, self._score = snapshot
+
+    def take_changes(self):
+        """
+        Stop recording the changes of a move for undo.
+        Returns the bitboard before the move
+        """
+        board = self._changes[0]
+        self._changes = None
+        return board
+
+    def revert(self, changes):
+        """
+        Put back the bitboard from before a move, as returned by 
+        take_changes.
+        """
+        self._board = changes
+
+    def set_tile(self, row, col, value):
+        """
+        Set the tile at position row, col to have the given value.
+        """
+        exponent = exponent_of(value)
+        if exponent > MAX_EXPONENT:
+            raise ValueError("a bitboard cell holds tiles up to %d, not %d" % 
+                             (1 << MAX_EXPONENT, value))
+        shift = 4 * (row * BITBOARD_SIZE + col)
+        self._board = (self._board & ~(NIBBLE_MASK << shift)) | (exponent << shift)
+
+    def get_tile(self, row, col):
+        """
+        Return the value of the tile at position row, col.
+        """
+        exponent = int((self._board >> (4 * (row * BITBOARD_SIZE + col))) & NIBBLE_MASK)
+        if exponent:
+            return 1 << exponent
+        return 0
+
+    def get_empty_squares(self):
+        """
+        Return the list of (row, col) tuples of the empty squares.
+        """
+        return [divmod(cell, BITBOARD_SIZE) for cell in bitboard_empty_cells(self._board)]
+
+    def is_game_over(self):
+        """
+        Return True if the grid is full and no two neighbouring 
+        tiles can merge.
+        """
+        if bitboard_empty_cells(self._board) != []:
+            return False
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            if bitboard_move(self._board, direction) != self._board:
+                return False
+        return True
+
+    def take_dirty_cells(self):
+        """
+        Return the set of (row, col) tuples of the squares whose 
+        value changed since the last call, or since the last reset.
+        """
+        if self._taken_board is None:
+            changed = range(BITBOARD_SIZE * BITBOARD_SIZE)
+        else:
+            difference = self._board ^ self._taken_board
+            changed = [cell for cell in range(BITBOARD_SIZE * BITBOARD_SIZE) 
+                       if (difference >> (4 * cell)) & NIBBLE_MASK]
+        self._taken_board = self._board
+        return set([divmod(cell, BITBOARD_SIZE) for cell in changed])
+
+    def get_bitboard(self):
+        """
+        Return the board packed into one integer.
+        """
+        return self._board
+
+    def set_bitboard(self, board):
+        """
+        Replace the board with a packed one.
+        """
+        self._board = board
+
+def heuristic_row(exponents):
+    """
+    Default heuristic for one row or column of exponents: rewards 
+    empty cells, possible merges and monotonic lines and penalises 
+    large tiles that are left scattered
+    """
+    empty = 0
+    merges = 0
+    previous = 0
+    counter = 0
+    total = 0.0
+    for exponent in exponents:
+        total += exponent ** HEURISTIC_SUM_POWER
+        if exponent == 0:
+            empty += 1
+        elif previous == exponent:
+            counter += 1
+        else:
+            if counter > 0:
+                merges += 1 + counter
+            counter = 0
+            previous = exponent
+    if counter > 0:
+        merges += 1 + counter
+    
+    monotonicity_left = 0.0
+    monotonicity_right = 0.0
+    for index in range(1, len(exponents)):
+        left = exponents[index - 1] ** HEURISTIC_MONOTONICITY_POWER
+        right = exponents[index] ** HEURISTIC_MONOTONICITY_POWER
+        if exponents[index - 1] > exponents[index]:
+            monotonicity_left += left - right
+        else:
+            monotonicity_right += right - left
+    
+    return (HEURISTIC_LOST_PENALTY + 
+            HEURISTIC_EMPTY_WEIGHT * empty + 
+            HEURISTIC_MERGE_WEIGHT * merges - 
+            HEURISTIC_MONOTONICITY_WEIGHT * min(monotonicity_left, monotonicity_right) - 
+            HEURISTIC_SUM_WEIGHT * total)
+
+_heuristic_tables = {}
+
+def build_heuristic_table(row_heuristic):
+    """
+    Precompute row_heuristic for each of the 65536 possible rows
+    Returns the table, which is shared by every player using row_heuristic
+    """
+    if row_heuristic not in _heuristic_tables:
+        _heuristic_tables[row_heuristic] = [
+            row_heuristic([(row >> (4 * col)) & NIBBLE_MASK for col in range(BITBOARD_SIZE)])
+            for row in range(1 << 16)]
+    return _heuristic_tables[row_heuristic]
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the time budget runs out.
+    """
+    pass
+
+class ExpectimaxPlayer:
+    """
+    Class to choose moves for the 4*4 game with depth-limited 
+    expectimax search over the player's moves and the random 
+    2 or 4 tile that follows each of them.
+    """
+
+    def __init__(self, row_heuristic = heuristic_row, 
+                 max_depth = MAX_SEARCH_DEPTH, cutoff = PROBABILITY_CUTOFF):
+        build_move_tables()
+        self._row_heuristic = row_heuristic
+        self._heuristic = build_heuristic_table(row_heuristic)
+        self._max_depth = max_depth
+        self._cutoff = cutoff
+        self._table = {}
+        self._deadline = None
+        self._nodes = 0
+        self._depth = 0
+        self._elapsed = 0.0
+
+    def get_nodes(self):
+        """
+        Getter for the number of nodes in the last search
+        Returns an int
+        """
+        return self._nodes
+
+    def get_depth(self):
+        """
+        Getter for the deepest fully searched depth of the last search
+        Returns an int
+        """
+        return self._depth
+
+    def get_nodes_per_second(self):
+        """
+        Getter for the search speed of the last search
+        Returns a float
+        """
+        if self._elapsed <= 0:
+            return 0.0
+        return self._nodes / self._elapsed
+
+    def evaluate(self, board):
+        """
+        Score a bitboard with the heuristic, over its rows and columns
+        Returns a float
+        """
+        heuristic = self._heuristic
+        columns = transpose_bitboard(board)
+        return (heuristic[board & ROW_MASK] + 
+                heuristic[(board >> 16) & ROW_MASK] + 
+                heuristic[(board >> 32) & ROW_MASK] + 
+                heuristic[(board >> 48) & ROW_MASK] + 
+                heuristic[columns & ROW_MASK] + 
+                heuristic[(columns >> 16) & ROW_MASK] + 
+                heuristic[(columns >> 32) & ROW_MASK] + 
+                heuristic[(columns >> 48) & ROW_MASK])
+
+    def best_move(self, game, time_budget = AI_TIME_BUDGET):
+        """
+        Search deeper and deeper until time_budget seconds have passed
+        Returns the best direction of the deepest finished search, 
+        or None if no move is possible
+        """
+        board = game_to_bitboard(game)
+        start = time.time()
+        self._deadline = start + time_budget
+        self._table = {}
+        self._nodes = 0
+        self._depth = 0
+        best = None
+        for depth in range(1, self._max_depth + 1):
+            try:
+                direction = self.search_root(board, depth)
+            except SearchTimeout:
+                break
+            if direction is None:
+                break
+            best = direction
+            self._depth = depth
+            if time.time() >= self._deadline:
+                break
+        self._table = {}
+        self._elapsed = time.time() - start
+        return best
+
+    def search_root(self, board, depth):
+        """
+        Helper function that scores each move to the given depth
+        Returns the best direction, or None if no move is possible
+        """
+        best = None
+        best_value = -1.0
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            moved = bitboard_move(board, direction)
+            if moved == board:
+                continue
+            value = self.chance_node(moved, depth - 1, 1.0)
+            if value > best_value:
+                best = direction
+                best_value = value
+        return best
+
+    def max_node(self, board, depth, probability):
+        """
+        Helper function that scores a board as its best move
+        """
+        best_value = 0.0
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            moved = bitboard_move(board, direction)
+            if moved != board:
+                best_value = max(best_value, self.chance_node(moved, depth - 1, probability))
+        return best_value
+
+    def chance_node(self, board, depth, probability):
+        """
+        Helper function that scores a board as the average over 
+        the tiles that may spawn on it
+        """
+        self._nodes += 1
+        if self._nodes % DEADLINE_CHECK_NODES == 0 and time.time() >= self._deadline:
+            raise SearchTimeout()
+        if depth <= 0 or probability < self._cutoff:
+            return self.evaluate(board)
+        
+        # boards reached again through other move orders are 
+        # scored once, unless they are now searched deeper
+        entry = self._table.get(board)
+        if entry is not None and entry[0] >= depth:
+            return entry[1]
+        
+        empty = bitboard_empty_cells(board)
+        probability /= len(empty)
+        total = 0.0
+        for cell in empty:
+            shift = 4 * cell
+            total += SPAWN_TWO_PROBABILITY * self.max_node(
+                board | (1 << shift), depth, probability * SPAWN_TWO_PROBABILITY)
+            total += (1 - SPAWN_TWO_PROBABILITY) * self.max_node(
+                board | (2 << shift), depth, probability * (1 - SPAWN_TWO_PROBABILITY))
+        value = total / len(empty)
+        self._table[board] = (depth, value)
+        return value
+
+def best_move(game, time_budget = AI_TIME_BUDGET):
+    """
+    Choose a move for a 4*4 game with the default expectimax player
+    Returns UP, DOWN, LEFT or RIGHT, or None if no move is possible
+    """
+    return ExpectimaxPlayer().best_move(game, time_budget)
+
+class BatchTwentyFortyEight:
+    """
+    Class to run many games of the same size at once on NumPy arrays, 
+    for statistics over large numbers of games.
+    """
+
+    def __init__(self, num_games, grid_height, grid_width, seed = None):
+        if numpy is None:
+            raise ImportError("the batch engine needs numpy")
+        self._num_games = num_games
+        self._grid_height = grid_height
+        self._grid_width = grid_width
+        self._random = numpy.random.RandomState(seed)
+        self.reset()
+
+    def reset(self):
+        """
+        Reset every game so its grid is empty except for two initial tiles.
+        """
+        self._cells = numpy.zeros((self._num_games, self._grid_height, self._grid_width), 
+                                  dtype = numpy.int64)
+        self._scores = numpy.zeros(self._num_games, dtype = numpy.int64)
+        everyone = numpy.ones(self._num_games, dtype = bool)
+        self.new_tiles(everyone)
+        self.new_tiles(everyone)
+
+    def get_num_games(self):
+        """
+        Getter for the number of games
+        Returns an int
+        """
+        return self._num_games
+
+    def get_grid_height(self):
+        """
+        Get the height of the boards.
+        """
+        return self._grid_height
+
+    def get_grid_width(self):
+        """
+        Get the width of the boards.
+        """
+        return self._grid_width
+
+    def get_cells(self):
+        """
+        Getter for the tiles of every game
+        Returns an (N, H, W) array
+        """
+        return self._cells
+
+    def get_scores(self):
+        """
+        Getter for the sum of merged tiles of every game
+        Returns an array of N ints
+        """
+        return self._scores
+
+    def get_tile(self, game, row, col):
+        """
+        Return the value of the tile at position row, col of one game.
+        """
+        return int(self._cells[game, row, col])
+
+    def move(self, directions):
+        """
+        Move all tiles of game i in directions[i], or every game in 
+        the same direction if directions is a single direction, and 
+        add a new tile to the games that changed. Games given any 
+        other value, such as 0, are left alone.
+        Returns the boolean arrays (changed, terminal)
+        """
+        directions = numpy.asarray(directions)
+        if directions.ndim == 0:
+            directions = numpy.repeat(directions, self._num_games)
+        changed = numpy.zeros(self._num_games, dtype = bool)
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            games = numpy.nonzero(directions == direction)[0]
+            if len(games) == 0:
+                continue
+            # Turn the boards so that every line slides towards index 0.
+            lines = self._cells[games]
+            if direction == UP or direction == DOWN:
+                lines = lines.transpose(0, 2, 1)
+            if direction == DOWN or direction == RIGHT:
+                lines = lines[:, :, ::-1]
+            merged, gained = slide_lines(lines)
+            if direction == DOWN or direction == RIGHT:
+                merged = merged[:, :, ::-1]
+            if direction == UP or direction == DOWN:
+                merged = merged.transpose(0, 2, 1)
+            changed[games] = (merged != self._cells[games]).any(axis = 2).any(axis = 1)
+            self._cells[games] = merged
+            self._scores[games] += gained
+        self.new_tiles(changed)
+        return changed, self.terminal()
+
+    def new_tiles(self, games):
+        """
+        Create a new tile in a randomly selected empty square of each 
+        game where games is True. The tile should be 2 90% of the time 
+        and 4 10% of the time.
+        """
+        flat = self._cells.reshape(self._num_games, -1)
+        empty = flat == 0
+        counts = empty.sum(axis = 1)
+        games = numpy.nonzero(numpy.asarray(games) & (counts > 0))[0]
+        if len(games) == 0:
+            return
+        values = numpy.where(self._random.random_sample(len(games)) < 0.9, 2, 4)
+        picks = (self._random.random_sample(len(games)) * counts[games]).astype(numpy.int64)
+        # the cell of the pick-th empty square of each game
+        cells = (empty[games].cumsum(axis = 1) > picks[:, None]).argmax(axis = 1)
+        flat[games, cells] = values
+
+    def terminal(self):
+        """
+        Find the games with no empty square and no possible merge
+        Returns a boolean array
+        """
+        cells = self._cells
+        full = (cells != 0).all(axis = 2).all(axis = 1)
+        across = (cells[:, :, 1:] == cells[:, :, :-1]).any(axis = 2).any(axis = 1)
+        down = (cells[:, 1:, :] == cells[:, :-1, :]).any(axis = 2).any(axis = 1)
+        return full & ~across & ~down
+
+def slide_lines(lines):
+    """
+    Helper function that merges every line of an (N, L, K) array 
+    towards index 0, the same way merge does with a single line
+    Returns the merged array and the sum of merged tiles per board
+    """
+    num_boards, num_lines, width = lines.shape
+    flat = lines.reshape(num_boards * num_lines, width)
+    rows = numpy.arange(len(flat))[:, None]
+    flat = flat[rows, numpy.argsort(flat == 0, axis = 1, kind = "mergesort")]
+    gained = numpy.zeros(len(flat), dtype = flat.dtype)
+    for col in range(width - 1):
+        pairs = (flat[:, col] == flat[:, col + 1]) & (flat[:, col] != 0)
+        flat[pairs, col] *= 2
+        flat[pairs, col + 1] = 0
+        gained[pairs] += flat[pairs, col]
+    flat = flat[rows, numpy.argsort(flat == 0, axis = 1, kind = "mergesort")]
+    return (flat.reshape(num_boards, num_lines, width), 
+            gained.reshape(num_boards, num_lines).sum(axis = 1))
+
+def symmetric_cells(cells):
+    """
+    Map a pattern of cell indices through the 8 rotations and 
+    reflections of the 4*4 board
+    Returns a list of 8 lists of cell indices
+    """
+    last = BITBOARD_SIZE - 1
     result = []
-    for num in line:
-        if num != 0:
-            result.append(num)
+    for transform in range(8):
+        mapped = []
+        for cell in cells:
+            row, col = divmod(cell, BITBOARD_SIZE)
+            for dummy_turn in range(transform % 4):
+                row, col = col, last - row
+            if transform >= 4:
+                col = last - col
+            mapped.append(row * BITBOARD_SIZE + col)
+        result.append(mapped)
+    return result
+
+class NTupleAgent:
+    """
+    Class to play the 4*4 game with an n-tuple network: the value of 
+    a board after a move is the sum of one weight per pattern and 
+    symmetry, looked up by the exponents under the pattern. It learns 
+    its weights by temporal difference learning over these afterstates, 
+    in training games whose tiles come from the random module, or from 
+    a generator of their own when the agent is seeded.
+    """
+
+    def __init__(self, patterns = NTUPLE_PATTERNS, weights = None, 
+                 learning_rate = NTUPLE_LEARNING_RATE, seed = None):
+        build_move_tables()
+        if seed is None:
+            self._random = random
+        else:
+            self._random = random.Random(seed)
+        self._patterns = patterns
+        if weights is None:
+            weights = array("f", [0.0]) * (len(patterns) * NTUPLE_TABLE_SIZE)
+        elif len(weights) != len(patterns) * NTUPLE_TABLE_SIZE:
+            raise ValueError("expected %d weights, got %d" % 
+                             (len(patterns) * NTUPLE_TABLE_SIZE, len(weights)))
+        self._weights = weights
+        self._learning_rate = learning_rate
+        # (table offset, shifts of the 4 cells) for every pattern and symmetry
+        self._features = []
+        for index in range(len(patterns)):
+            for cells in symmetric_cells(patterns[index]):
+                self._features.append(tuple([index * NTUPLE_TABLE_SIZE] + 
+                                            [4 * cell for cell in cells]))
+        self._nodes = 0
+        self._elapsed = 0.0
+
+    def get_weights(self):
+        """
+        Getter for the flat weight table
+        Returns an array of floats
+        """
+        return self._weights
+
+    def get_depth(self):
+        """
+        Getter for the search depth, which is always one move
+        Returns an int
+        """
+        return 1
+
+    def get_nodes(self):
+        """
+        Getter for the number of boards valued for the last move
+        Returns an int
+        """
+        return self._nodes
+
+    def get_nodes_per_second(self):
+        """
+        Getter for the valuing speed of the last move
+        Returns a float
+        """
+        if self._elapsed <= 0:
+            return 0.0
+        return self._nodes / self._elapsed
+
+    def feature_indices(self, board):
+        """
+        Find the weight looked up by each pattern and symmetry
+        Returns a list of indices into the weight table
+        """
+        return [offset | ((board >> shift0) & NIBBLE_MASK) | 
+                (((board >> shift1) & NIBBLE_MASK) << 4) | 
+                (((board >> shift2) & NIBBLE_MASK) << 8) | 
+                (((board >> shift3) & NIBBLE_MASK) << 12) 
+                for offset, shift0, shift1, shift2, shift3 in self._features]
+
+    def value(self, board):
+        """
+        Value a bitboard after a move
+        Returns a float
+        """
+        weights = self._weights
+        return sum([weights[index] for index in self.feature_indices(board)])
+
+    def choose(self, board):
+        """
+        Find the move with the best reward plus afterstate value
+        Returns (direction, afterstate, reward), or None if no move 
+        is possible
+        """
+        best = None
+        best_value = None
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            afterstate = bitboard_move(board, direction)
+            if afterstate == board:
+                continue
+            reward = bitboard_move_score(board, direction)
+            value = reward + self.value(afterstate)
+            self._nodes += 1
+            if best is None or value > best_value:
+                best = (direction, afterstate, reward)
+                best_value = value
+        return best
+
+    def best_move(self, game, time_budget = None):
+        """
+        Choose a move for a 4*4 game. The time budget is ignored, as 
+        the agent only looks one move ahead.
+        Returns UP, DOWN, LEFT or RIGHT, or None if no move is possible
+        """
+        start = time.time()
+        self._nodes = 0
+        board = game_to_bitboard(game)
+        choice = self.choose(board)
+        self._elapsed = time.time() - start
+        if choice is None:
+            return None
+        return choice[0]
+
+    def learn(self, afterstate, target):
+        """
+        Move the value of an afterstate towards target, sharing the 
+        step between all of its weights.
+        """
+        indices = self.feature_indices(afterstate)
+        weights = self._weights
+        error = target - sum([weights[index] for index in indices])
+        step = self._learning_rate * error / len(indices)
+        for index in indices:
+            weights[index] += step
+
+    def train_game(self):
+        """
+        Play one game from two random tiles, learning after every move
+        Returns the final score and the largest tile
+        """
+        rng = self._random
+        board = spawn_bitboard_tile(spawn_bitboard_tile(0, rng), rng)
+        score = 0
+        previous = None
+        choice = self.choose(board)
+        while choice is not None:
+            direction, afterstate, reward = choice
+            score += reward
+            board = spawn_bitboard_tile(afterstate, rng)
+            choice = self.choose(board)
+            if previous is not None:
+                self.learn(previous, reward + self.value(afterstate))
+            previous = afterstate
+        if previous is not None:
+            # nothing follows the last afterstate
+            self.learn(previous, 0.0)
+        largest = max([(board >> (4 * cell)) & NIBBLE_MASK 
+                       for cell in range(BITBOARD_SIZE * BITBOARD_SIZE)])
+        return score, 1 << largest
+
+    def train(self, num_games):
+        """
+        Train on num_games headless games, one after the other in 
+        this process. Each game learns from the weights left by the 
+        last, so training is not spread over processes; it runs at 
+        10 to 30 games a second, the fewer the longer the agent lasts.
+        Returns the mean score and the largest tile reached
+        """
+        total = 0
+        largest = 0
+        for dummy_game in range(num_games):
+            score, tile = self.train_game()
+            total += score
+            largest = max(largest, tile)
+        return float(total) / max(num_games, 1), largest
+
+    def save(self, path):
+        """
+        Write the weights to path as raw little-endian 32-bit floats.
+        """
+        weights = array("f", self._weights)
+        if sys.byteorder == "big":
+            weights.byteswap()
+        with open(path, "wb") as weights_file:
+            weights.tofile(weights_file)
+
+def load_ntuple_agent(path, patterns = NTUPLE_PATTERNS):
+    """
+    Create an n-tuple agent from weights saved by NTupleAgent.save. 
+    Where possible the file is memory-mapped copy-on-write, so even 
+    large tables load at once and further training leaves the file 
+    alone.
+    Returns an NTupleAgent
+    """
+    with open(path, "rb") as weights_file:
+        size = os.fstat(weights_file.fileno()).st_size
+        if sys.byteorder == "little" and hasattr(memoryview, "cast") and size > 0:
+            mapped = mmap.mmap(weights_file.fileno(), 0, access = mmap.ACCESS_COPY)
+            weights = memoryview(mapped).cast("f")
+        else:
+            weights = array("f")
+            weights.fromfile(weights_file, size // weights.itemsize)
+            if sys.byteorder == "big":
+                weights.byteswap()
+    return NTupleAgent(patterns, weights)
+
+def spawn_bitboard_tile(board, rng = random):
+    """
+    Put a 2 (90% of the time) or a 4 on a random empty cell of a 
+    bitboard, drawing from rng, the random module by default
+    Returns the new bitboard
+    """
+    empty = bitboard_empty_cells(board)
+    if empty == []:
+        return board
+    if rng.random() < SPAWN_TWO_PROBABILITY:
+        tile = 1
+    else:
+        tile = 2
+    return board | (tile << (4 * rng.choice(empty)))
+
+def run_rollouts(task):
+    """
+    Worker function that plays count random games to the end from 
+    a grid, after first moving it in the given direction. Each random 
+    move is drawn from the directions that move tiles. The games draw 
+    their tiles and moves from one generator seeded with seed.
+    Returns the total final score and the total number of random moves
+    """
+    grid_height, grid_width, tiles, score, direction, seed, count = task
+    if grid_height == BITBOARD_SIZE and grid_width == BITBOARD_SIZE:
+        game = BitboardTwentyFortyEight(grid_height, grid_width, seed)
+    else:
+        game = TwentyFortyEight(grid_height, grid_width, seed)
+    rng = game.get_random()
+    directions = [UP, DOWN, LEFT, RIGHT]
+    total_score = 0
+    total_moves = 0
+    for dummy_rollout in range(count):
+        game.set_grid(tiles, score)
+        game.move(direction)
+        while True:
+            legal = [option for option in directions 
+                     if game.move_score(option) is not None]
+            if legal == []:
+                break
+            game.move(rng.choice(legal))
+            total_moves += 1
+        total_score += game.get_score()
+    return total_score, total_moves
+
+class MonteCarloPlayer:
+    """
+    Class to choose moves for a game of any size by playing random 
+    games to the end after each possible direction and picking the 
+    direction with the best mean final score.
     
-    for index in range(len(result)-1):
-        if result[index] == result[index+1]:
-            result[index] *= 2
-            result[index+1] = 0
+    The rollouts run in rounds of one chunk per direction, spread over 
+    a pool of worker processes. Each chunk has its own seed drawn from 
+    the player's generator and the results are added up in direction 
+    order, so a seeded player without a time budget always makes the 
+    same moves, whatever the number of workers. Without multiprocessing, 
+    or with num_workers set to 0, the rollouts run in this process.
+    """
+
+    def __init__(self, rollouts = MC_ROLLOUTS, num_workers = None, seed = None, 
+                 chunk_size = MC_CHUNK_SIZE):
+        self._rollouts = rollouts
+        self._chunk_size = chunk_size
+        self._random = random.Random(seed)
+        if multiprocessing is None:
+            num_workers = 0
+        elif num_workers is None:
+            num_workers = multiprocessing.cpu_count()
+        self._pool = None
+        if num_workers > 0:
+            # build the tables before forking, so workers share them
+            build_move_tables()
+            self._pool = multiprocessing.Pool(num_workers)
+        self._done = 0
+        self._nodes = 0
+        self._elapsed = 0.0
+
+    def close(self):
+        """
+        Shut down the worker processes.
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def get_rollouts(self):
+        """
+        Getter for the number of rollouts of the last move, per direction
+        Returns an int
+        """
+        return self._done
+
+    def get_nodes(self):
+        """
+        Getter for the number of random moves played for the last move
+        Returns an int
+        """
+        return self._nodes
+
+    def get_nodes_per_second(self):
+        """
+        Getter for the rollout speed of the last move
+        Returns a float
+        """
+        if self._elapsed <= 0:
+            return 0.0
+        return self._nodes / self._elapsed
+
+    def best_move(self, game, time_budget = MC_TIME_BUDGET):
+        """
+        Play rollouts in rounds until each legal direction has had 
+        its share, or until time_budget seconds have passed after 
+        at least one round. A time budget of None never stops early.
+        Returns the best direction, or None if no move is possible
+        """
+        start = time.time()
+        grid_height = game.get_grid_height()
+        grid_width = game.get_grid_width()
+        tiles = tuple([tuple([game.get_tile(row, col) for col in range(grid_width)]) 
+                       for row in range(grid_height)])
+        score = game.get_score()
+        legal = [direction for direction in (UP, DOWN, LEFT, RIGHT) 
+                 if game.move_score(direction) is not None]
+        self._done = 0
+        self._nodes = 0
+        if legal == []:
+            self._elapsed = time.time() - start
+            return None
+        
+        totals = dict([(direction, 0) for direction in legal])
+        while self._done < self._rollouts:
+            count = min(self._chunk_size, self._rollouts - self._done)
+            tasks = [(grid_height, grid_width, tiles, score, direction, 
+                      self._random.randrange(1 << 30), count) for direction in legal]
+            if self._pool is None:
+                results = [run_rollouts(task) for task in tasks]
+            else:
+                results = self._pool.map(run_rollouts, tasks)
+            for direction, result in zip(legal, results):
+                totals[direction] += result[0]
+                self._nodes += result[1]
+            self._done += count
+            if time_budget is not None and time.time() - start >= time_budget:
+                break
+        
+        best = legal[0]
+        for direction in legal:
+            if totals[direction] > totals[best]:
+                best = direction
+        self._elapsed = time.time() - start
+        return best
+
+def policy_random(game, rng, move_number, script):
+    """
+    Policy that picks any direction that moves tiles
+    """
+    legal = [direction for direction in (UP, DOWN, LEFT, RIGHT) 
+             if game.move_score(direction) is not None]
+    return rng.choice(legal)
+
+def policy_greedy(game, rng, move_number, script):
+    """
+    Policy that picks the direction adding the most score, 
+    the first in UP, DOWN, LEFT, RIGHT order on a tie
+    """
+    best = None
+    best_score = None
+    for direction in (UP, DOWN, LEFT, RIGHT):
+        score = game.move_score(direction)
+        if score is not None and (best is None or score > best_score):
+            best = direction
+            best_score = score
+    return best
+
+def policy_corner(game, rng, move_number, script):
+    """
+    Policy that keeps the tiles in the bottom left corner, moving 
+    down or left when it can and right or up only when it must
+    """
+    for direction in (DOWN, LEFT, RIGHT, UP):
+        if game.move_score(direction) is not None:
+            return direction
+
+def policy_scripted(game, rng, move_number, script):
+    """
+    Policy that cycles through the directions of script, a string 
+    of the letters U, D, L and R, skipping ahead past any direction 
+    that moves no tiles
+    """
+    letters = {"U": UP, "D": DOWN, "L": LEFT, "R": RIGHT}
+    for offset in range(len(script)):
+        direction = letters[script[(move_number + offset) % len(script)]]
+        if game.move_score(direction) is not None:
+            return direction
+    return policy_corner(game, rng, move_number, script)
+
+POLICIES = {"random": policy_random,
+            "greedy": policy_greedy,
+            "corner": policy_corner,
+            "scripted": policy_scripted}
+
+def play_stats_game(task):
+    """
+    Worker function that plays one game to the end with a policy, 
+    drawing its tiles and random choices from a generator seeded 
+    with seed
+    Returns a dictionary of the HARNESS_FIELDS of the game
+    """
+    index, seed, policy_name, script, grid_height, grid_width = task
+    start = time.time()
+    if grid_height == BITBOARD_SIZE and grid_width == BITBOARD_SIZE:
+        game = BitboardTwentyFortyEight(grid_height, grid_width, seed)
+    else:
+        game = TwentyFortyEight(grid_height, grid_width, seed)
+    policy = POLICIES[policy_name]
+    rng = game.get_random()
+    moves = 0
+    while not game.is_game_over():
+        game.move(policy(game, rng, moves, script))
+        moves += 1
+    max_tile = max([game.get_tile(row, col) for row in range(grid_height) 
+                    for col in range(grid_width)])
+    return {"game": index, "seed": seed, "score": game.get_score(), 
+            "max_tile": max_tile, "moves": moves, 
+            "duration": round(time.time() - start, 6)}
+
+class RunningStats:
+    """
+    Class to keep aggregates over any number of game results in 
+    constant memory.
+    """
+
+    def __init__(self, state = None):
+        if state is None:
+            state = {"games": 0, "mean_score": 0.0, "score_m2": 0.0, 
+                     "best_score": 0, "total_moves": 0, "total_duration": 0.0, 
+                     "elapsed": 0.0, "max_tiles": {}}
+        # checkpoints saved before wall-clock time was kept lack it
+        state.setdefault("elapsed", 0.0)
+        self._state = state
+
+    def add(self, result):
+        """
+        Fold one game result into the aggregates.
+        """
+        state = self._state
+        state["games"] += 1
+        # Welford's update of the mean and the squared deviations
+        delta = result["score"] - state["mean_score"]
+        state["mean_score"] += delta / state["games"]
+        state["score_m2"] += delta * (result["score"] - state["mean_score"])
+        state["best_score"] = max(state["best_score"], result["score"])
+        state["total_moves"] += result["moves"]
+        state["total_duration"] += result["duration"]
+        tile = str(result["max_tile"])
+        state["max_tiles"][tile] = state["max_tiles"].get(tile, 0) + 1
+
+    def add_elapsed(self, seconds):
+        """
+        Add the wall-clock time taken to play some of the games, 
+        which is less than the sum of their durations when they are 
+        played by several workers at once.
+        """
+        self._state["elapsed"] += seconds
+
+    def get_state(self):
+        """
+        Getter for the aggregates, in a form json can save
+        Returns a dictionary
+        """
+        return self._state
+
+    def summary(self):
+        """
+        Summarise the aggregates
+        Returns a dictionary
+        """
+        state = self._state
+        games = state["games"]
+        summary = {"games": games, "mean_score": state["mean_score"], 
+                   "best_score": state["best_score"], "max_tiles": state["max_tiles"]}
+        if games > 1:
+            summary["score_stdev"] = math.sqrt(state["score_m2"] / (games - 1))
+        if games > 0:
+            summary["mean_moves"] = float(state["total_moves"]) / games
+            # wall-clock time where the harness kept it, else game time
+            elapsed = state["elapsed"] or state["total_duration"]
+            summary["games_per_second"] = games / max(elapsed, 1e-9)
+        return summary
+
+def parse_harness_args(argv):
+    """
+    Parse the command line of the statistics harness
+    Returns an argparse namespace
+    """
+    parser = argparse.ArgumentParser(description = "Play many 2048 games with a policy "
+                                     "and stream the result of each game.")
+    parser.add_argument("--games", type = int, default = 10000)
+    parser.add_argument("--policy", choices = sorted(POLICIES.keys()), default = "random")
+    parser.add_argument("--script", default = "DLDR", 
+                        help = "directions for the scripted policy, as U, D, L and R")
+    parser.add_argument("--height", type = int, default = 4)
+    parser.add_argument("--width", type = int, default = 4)
+    parser.add_argument("--seed", type = int, default = 0, 
+                        help = "game i is seeded with seed + i")
+    parser.add_argument("--workers", type = int, default = None, 
+                        help = "worker processes, 0 to play in this process")
+    parser.add_argument("--format", choices = ["ndjson", "csv"], default = "ndjson")
+    parser.add_argument("--output", default = None, 
+                        help = "file to stream results to, instead of standard output")
+    parser.add_argument("--checkpoint", default = None, 
+                        help = "file to save progress to, and to resume from if it exists")
+    parser.add_argument("--block", type = int, default = HARNESS_BLOCK_SIZE, 
+                        help = "games between two checkpoints")
+    args = parser.parse_args(argv)
+    if args.policy == "scripted" and (args.script == "" or 
+                                      [letter for letter in args.script if letter not in "UDLR"]):
+        parser.error("--script must be made of the letters U, D, L and R")
+    if args.checkpoint is not None and args.output is None:
+        # resuming truncates the output file to its saved length, 
+        # which standard output can neither report nor do
+        parser.error("--checkpoint needs --output")
+    return args
+
+def format_result(result, output_format):
+    """
+    Helper function that writes one game result as a line
+    """
+    if output_format == "csv":
+        return ",".join([str(result[field]) for field in HARNESS_FIELDS]) + "\n"
+    return json.dumps(result, sort_keys = True) + "\n"
+
+def run_harness(argv):
+    """
+    Play the games asked for on the command line argv, streaming 
+    one line per game in game order and a summary to standard error.
+    
+    With --checkpoint, which needs --output, the next game, the 
+    aggregates and the length of the output file are saved after 
+    every block of games. A later run with the same arguments truncates the output to that length 
+    and carries on from there, so no game is lost or written twice.
+    Returns the summary dictionary
+    """
+    args = parse_harness_args(argv)
+    next_game = 0
+    stats = RunningStats()
+    output_bytes = 0
+    if args.checkpoint is not None and os.path.exists(args.checkpoint):
+        with open(args.checkpoint) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        next_game = checkpoint["next_game"]
+        stats = RunningStats(checkpoint["stats"])
+        output_bytes = checkpoint["output_bytes"]
     
-    for num in result:
-        if num == 0:
-            result.remove(num)
+    if args.output is None:
+        output = sys.stdout
+    elif output_bytes > 0:
+        output = open(args.output, "r+")
+        output.seek(output_bytes)
+        output.truncate()
+    else:
+        output = open(args.output, "w")
+    if next_game == 0 and args.format == "csv":
+        output.write(",".join(HARNESS_FIELDS) + "\n")
     
-    while len(result) < len(line):
-        result.append(0)
+    num_workers = args.workers
+    if multiprocessing is None:
+        num_workers = 0
+    elif num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    # build the tables up front, so they are neither timed with the 
+    # first game nor built again by every worker
+    build_move_tables()
+    pool = None
+    if num_workers > 0:
+        pool = multiprocessing.Pool(num_workers)
+    try:
+        while next_game < args.games:
+            block_start = time.time()
+            stop = min(next_game + args.block, args.games)
+            tasks = [(index, args.seed + index, args.policy, args.script, 
+                      args.height, args.width) for index in range(next_game, stop)]
+            if pool is None:
+                results = (play_stats_game(task) for task in tasks)
+            else:
+                results = pool.imap(play_stats_game, tasks, 
+                                    max(1, len(tasks) // (4 * num_workers)))
+            for result in results:
+                output.write(format_result(result, args.format))
+                stats.add(result)
+            next_game = stop
+            output.flush()
+            stats.add_elapsed(time.time() - block_start)
+            if args.checkpoint is not None:
+                save_checkpoint(args.checkpoint, {"next_game": next_game, 
+                                                  "stats": stats.get_state(), 
+                                                  "output_bytes": output.tell()})
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if output is not sys.stdout:
+            output.close()
+    summary = stats.summary()
+    sys.stderr.write(json.dumps(summary, sort_keys = True) + "\n")
+    return summary
+
+def save_checkpoint(path, checkpoint):
+    """
+    Helper function that writes a checkpoint next to path and then 
+    moves it over path, so a crash never leaves half a checkpoint
+    """
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, sort_keys = True)
+    if hasattr(os, "replace"):
+        os.replace(temporary_path, path)
+    else:
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(temporary_path, path)
+
+def write_varint(buf, value):
+    """
+    Append a non-negative integer to the bytearray, seven bits per byte
+    """
+    while value >= 0x80:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
     
-    return result
+def read_varint(data, offset):
+    """
+    Read an integer written by write_varint from the bytearray
+    Returns the integer and the offset just past it
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+class GameRecorder:
+    """
+    Class to record a game as the magic, the grid size, the seed plus 
+    one (0 if unseeded), the score and the tiles at the start as varints, 
+    then one byte per move, holding the direction and whether a 4 
+    spawned, followed by the varint cell index of the new tile.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._offsets = []
+
+    def start(self, game):
+        """
+        Start the record over from the current grid of game.
+        """
+        buf = bytearray([ord(char) for char in RECORD_MAGIC])
+        write_varint(buf, game.get_grid_height())
+        write_varint(buf, game.get_grid_width())
+        if game.get_seed() is None:
+            write_varint(buf, 0)
+        else:
+            write_varint(buf, game.get_seed() + 1)
+        write_varint(buf, game.get_score())
+        tiles = [(row * game.get_grid_width() + col, game.get_tile(row, col)) 
+                 for row in range(game.get_grid_height()) 
+                 for col in range(game.get_grid_width()) if game.get_tile(row, col)]
+        write_varint(buf, len(tiles))
+        for index, tile in tiles:
+            write_varint(buf, index)
+            write_varint(buf, exponent_of(tile))
+        self._buf = buf
+        self._offsets = []
+
+    def record(self, direction, spawn):
+        """
+        Log one move and the (cell index, value) of the tile it 
+        spawned, or None if none spawned
+        """
+        self._offsets.append(len(self._buf))
+        if spawn is None:
+            self._buf.append(direction | RECORD_NO_SPAWN)
+            return
+        index, value = spawn
+        if value == 4:
+            self._buf.append(direction | RECORD_SPAWNED_FOUR)
+        else:
+            self._buf.append(direction)
+        write_varint(self._buf, index)
+
+    def undo(self):
+        """
+        Drop the last move logged.
+        """
+        if self._offsets:
+            del self._buf[self._offsets.pop():]
 
-def run_gui(game):
+    def get_num_moves(self):
+        """
+        Getter for the number of moves logged
+        Returns an int
+        """
+        return len(self._offsets)
+
+    def to_bytes(self):
+        """
+        Getter for the record
+        Returns a bytearray
+        """
+        return bytearray(self._buf)
+
+class GameRecord:
+    """
+    Class to read a record written by GameRecorder and to rebuild the 
+    game after any number of its moves. Reading the record replays it 
+    once, keeping a snapshot every RECORD_KEYFRAME_INTERVAL moves, so 
+    that any point is reached by replaying fewer moves than that.
+    """
+
+    def __init__(self, data):
+        data = bytearray(data)
+        if data[:len(RECORD_MAGIC)] != bytearray([ord(char) for char in RECORD_MAGIC]):
+            raise ValueError("not a 2048 game record")
+        offset = len(RECORD_MAGIC)
+        self._grid_height, offset = read_varint(data, offset)
+        self._grid_width, offset = read_varint(data, offset)
+        seed, offset = read_varint(data, offset)
+        self._seed = None
+        if seed > 0:
+            self._seed = seed - 1
+        score, offset = read_varint(data, offset)
+        count, offset = read_varint(data, offset)
+        tiles = [0] * (self._grid_height * self._grid_width)
+        for dummy_tile in range(count):
+            index, offset = read_varint(data, offset)
+            exponent, offset = read_varint(data, offset)
+            tiles[index] = 1 << exponent
+        self._data = data
+        
+        game = self.new_game()
+        game.set_grid([tiles[row * self._grid_width:(row + 1) * self._grid_width] 
+                       for row in range(self._grid_height)], score)
+        snapshot = game.snapshot()
+        # (move number, offset of its event, snapshot before it)
+        self._keyframes = []
+        num_moves = 0
+        while True:
+            self._keyframes.append((num_moves, offset, snapshot))
+            snapshot, offset, count = self.advance(snapshot, offset, RECORD_KEYFRAME_INTERVAL)
+            num_moves += count
+            if count < RECORD_KEYFRAME_INTERVAL:
+                break
+        self._num_moves = num_moves
+        game.restore(snapshot)
+        self._final = game
+
+    def new_game(self):
+        """
+        Helper function that makes an engine for the recorded grid
+        """
+        if self._grid_height == BITBOARD_SIZE and self._grid_width == BITBOARD_SIZE:
+            return BitboardTwentyFortyEight(seed = 0)
+        return TwentyFortyEight(self._grid_height, self._grid_width, 0)
+
+    def advance(self, snapshot, offset, count):
+        """
+        Helper function that replays up to count moves from offset, 
+        starting from snapshot
+        Returns the snapshot after them, the offset of the next move 
+        and the number of moves replayed
+        """
+        data = self._data
+        end = len(data)
+        done = 0
+        if self._grid_height == BITBOARD_SIZE and self._grid_width == BITBOARD_SIZE:
+            # straight on the bitboard, as the cell index of a 4*4 
+            # grid always fits in a single varint byte
+            board, score = snapshot
+            while done < count and offset < end:
+                event = data[offset]
+                direction = event & 0x07
+                score += bitboard_move_score(board, direction)
+                board = bitboard_move(board, direction)
+                if event & RECORD_NO_SPAWN:
+                    offset += 1
+                elif event & RECORD_SPAWNED_FOUR:
+                    board |= 2 << (4 * data[offset + 1])
+                    offset += 2
+                else:
+                    board |= 1 << (4 * data[offset + 1])
+                    offset += 2
+                done += 1
+            return (board, score), offset, done
+        
+        game = self.new_game()
+        game.restore(snapshot)
+        while done < count and offset < end:
+            event = data[offset]
+            game.slide(event & 0x07)
+            offset += 1
+            if not event & RECORD_NO_SPAWN:
+                index, offset = read_varint(data, offset)
+                row, col = divmod(index, self._grid_width)
+                if event & RECORD_SPAWNED_FOUR:
+                    game.set_tile(row, col, 4)
+                else:
+                    game.set_tile(row, col, 2)
+            done += 1
+        return game.snapshot(), offset, done
+
+    def get_num_moves(self):
+        """
+        Getter for the number of moves in the record
+        Returns an int
+        """
+        return self._num_moves
+
+    def get_seed(self):
+        """
+        Getter for the seed of the recorded game, None if it was not seeded
+        Returns an int or None
+        """
+        return self._seed
+
+    def get_final_game(self):
+        """
+        Getter for the game as it was at the end of the record. 
+        It is shared, so copy it with game_at to play on.
+        Returns a game
+        """
+        return self._final
+
+    def game_at(self, move_number):
+        """
+        Rebuild the game as it was after move_number moves
+        Returns a new game
+        """
+        if move_number < 0 or move_number > self._num_moves:
+            raise ValueError("the record has %d moves" % self._num_moves)
+        start, offset, snapshot = self._keyframes[move_number // RECORD_KEYFRAME_INTERVAL]
+        snapshot = self.advance(snapshot, offset, move_number - start)[0]
+        game = self.new_game()
+        game.restore(snapshot)
+        return game
+
+def run_gui(game, player = None):
     """
     Instantiate and run the GUI.
     """
-    gui = GUI(game)
+    gui = GUI(game, player)
     gui.start()
 
-run_gui(TwentyFortyEight(4, 4))
\ No newline at end of file
+# Uncomment the lines below to train an n-tuple agent headless and 
+# save its weights, or to let the trained agent play in the GUI.
+
+# agent = NTupleAgent()
+# print(agent.train(1000))
+# agent.save(NTUPLE_WEIGHTS_FILE)
+# run_gui(TwentyFortyEight(4, 4), load_ntuple_agent(NTUPLE_WEIGHTS_FILE))
+
+# Pass arguments on the command line to play games headless with 
+# run_harness(), e.g. --games 1000000 --policy corner --output run.ndjson 
+# --checkpoint run.ckpt
+
+if __name__ == "__main__":
+    if json is not None and array is not None and len(sys.argv) > 1:
+        run_harness(sys.argv[1:])
+    else:
+        run_gui(TwentyFortyEight(4, 4))
@@ -13,6 +13,16 @@ please visit the following URL with Google Chrome.
 import random
 import simplegui
 
+# mc_batch_scores needs NumPy
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
 # Constants for Monte Carlo simulator
 # Values of these constants can be changed as desired,
 # but do not change their names.
@@ -25,6 +35,17 @@ PLAYERX = 2
 PLAYERO = 3 
 DRAW = 4
 
+# Batched trials: the fewest trials worth batching and the most 
+# trials played at once, which bounds the memory used. The fixed cost 
+# of a batch is that of some 50 to 150 single trials on 3*3, depending 
+# on the machine.
+MC_BATCH_MIN_TRIALS = 200
+MC_BATCH_SIZE = 65536
+
+# Seeded or multi-process trials are split into this many shares, 
+# each with its own seed, whatever the number of workers.
+MC_SHARES = 32
+
 GUI_WIDTH = 400
 GUI_HEIGHT = GUI_WIDTH
 BAR_WIDTH = 5
@@ -34,9 +55,40 @@ STRMAP = {EMPTY: " ",
           PLAYERX: "X",
           PLAYERO: "O"}
 
+# Precomputed masks of each board dimension, see board_masks
+_board_masks = {}
+
+def board_masks(dim):
+    """
+    Precompute, once per dimension, the bit masks of a board whose 
+    square (row, col) is bit row * dim + col.
+    Returns a tuple of the masks of all lines (rows, then columns, 
+    then both diagonals), the masks of the lines through each square, 
+    the mask of the full board and a dictionary from each single bit 
+    to its (row, col) square
+    """
+    if dim not in _board_masks:
+        rows = [sum([1 << (row * dim + col) for col in range(dim)]) 
+                for row in range(dim)]
+        cols = [sum([1 << (row * dim + col) for row in range(dim)]) 
+                for col in range(dim)]
+        diag1 = sum([1 << (idx * dim + idx) for idx in range(dim)])
+        diag2 = sum([1 << (idx * dim + dim - idx - 1) for idx in range(dim)])
+        lines = rows + cols + [diag1, diag2]
+        cell_lines = [[line for line in lines if line & (1 << cell)] 
+                      for cell in range(dim * dim)]
+        squares = dict([(1 << (row * dim + col), (row, col)) 
+                        for row in range(dim) for col in range(dim)])
+        _board_masks[dim] = (lines, cell_lines, (1 << (dim * dim)) - 1, squares)
+    return _board_masks[dim]
+
 class TTTBoard:
     """
     Class to represent a Tic-Tac-Toe board.
+    
+    The squares of each player are kept as the bits of one integer, 
+    and the winner is found when a move completes a line through 
+    its square, so moves, clones and check_win take constant time.
     """
 
     def __init__(self, dim, reverse = False, board = None):
@@ -46,14 +98,26 @@ class TTTBoard:
         """ 
         self._dim = dim
         self._reverse = reverse
-        if board == None:
-            # Create empty board
-            self._board = [[EMPTY for dummycol in range(dim)] 
-                           for dummyrow in range(dim)]
-        else:
+        self._masks = board_masks(dim)
+        self._xbits = 0
+        self._obits = 0
+        self._winner = None
+        if board != None:
             # Copy board grid
-            self._board = [[board[row][col] for col in range(dim)] 
-                           for row in range(dim)]
+            for row in range(dim):
+                for col in range(dim):
+                    if board[row][col] == PLAYERX:
+                        self._xbits |= 1 << (row * dim + col)
+                    elif board[row][col] == PLAYERO:
+                        self._obits |= 1 << (row * dim + col)
+            # the first complete line wins, as rows, columns, diagonals
+            for line in self._masks[0]:
+                if self._xbits & line == line:
+                    self._winner = PLAYERX
+                    break
+                elif self._obits & line == line:
+                    self._winner = PLAYERO
+                    break
             
     def __str__(self):
         """
@@ -62,7 +126,7 @@ class TTTBoard:
         rep = ""
         for row in range(self._dim):
             for col in range(self._dim):
-                rep += STRMAP[self._board[row][col]]
+                rep += STRMAP[self.square(row, col)]
                 if col == self._dim - 1:
                     rep += "\n"
                 else:
@@ -77,23 +141,37 @@ class TTTBoard:
         Return the dimension of the board.
         """
         return self._dim
+
+    def get_reverse(self):
+        """
+        Return whether the game is reversed.
+        """
+        return self._reverse
     
     def square(self, row, col):
         """
         Returns one of the three constants EMPTY, PLAYERX, or PLAYERO 
         that correspond to the contents of the board at position (row, col).
          """
-        return self._board[row][col]
+        bit = 1 << (row * self._dim + col)
+        if self._xbits & bit:
+            return PLAYERX
+        elif self._obits & bit:
+            return PLAYERO
+        return EMPTY
 
     def get_empty_squares(self):
         """
         Return a list of (row, col) tuples for all empty squares
         """
+        squares = self._masks[3]
+        empty_bits = self._masks[2] & ~(self._xbits | self._obits)
         empty = []
-        for row in range(self._dim):
-            for col in range(self._dim):
-                if self._board[row][col] == EMPTY:
-                    empty.append((row, col))
+        while empty_bits:
+            # lowest set bit first, so squares come in row-major order
+            bit = empty_bits & -empty_bits
+            empty.append(squares[bit])
+            empty_bits ^= bit
         return empty
 
     def move(self, row, col, player):
@@ -102,8 +180,58 @@ class TTTBoard:
         player should be either the constant PLAYERX or PLAYERO.
         Does nothing if board square is not empty.
         """
-        if self._board[row][col] == EMPTY:
-            self._board[row][col] = player
+        cell = row * self._dim + col
+        bit = 1 << cell
+        if (self._xbits | self._obits) & bit:
+            return
+        if player == PLAYERX:
+            self._xbits |= bit
+            bits = self._xbits
+        else:
+            self._obits |= bit
+            bits = self._obits
+        if self._winner is None:
+            for line in self._masks[1][cell]:
+                if bits & line == line:
+                    self._winner = player
+                    break
+
+    def play_random(self, player):
+        """
+        Play random moves, starting with player and alternating 
+        between players, until the game is over.
+        """
+        if self._winner is not None:
+            return
+        cell_lines = self._masks[1]
+        xbits = self._xbits
+        obits = self._obits
+        empty_bits = self._masks[2] & ~(xbits | obits)
+        cells = [cell for cell in range(self._dim * self._dim) 
+                 if empty_bits & (1 << cell)]
+        # Choosing a random empty square at every turn is the same as 
+        # playing the empty squares in a random order, shuffled once.
+        random.shuffle(cells)
+        x_to_move = player == PLAYERX
+        for cell in cells:
+            if x_to_move:
+                xbits |= 1 << cell
+                bits = xbits
+            else:
+                obits |= 1 << cell
+                bits = obits
+            for line in cell_lines[cell]:
+                if bits & line == line:
+                    if x_to_move:
+                        self._winner = PLAYERX
+                    else:
+                        self._winner = PLAYERO
+                    break
+            if self._winner is not None:
+                break
+            x_to_move = not x_to_move
+        self._xbits = xbits
+        self._obits = obits
 
     def check_win(self):
         """
@@ -113,36 +241,14 @@ class TTTBoard:
             If game is drawn, returns DRAW.
             If game is in progress, returns None.
         """
-        board = self._board
-        dim = self._dim
-        dimrng = range(dim)
-        lines = []
-
-        # rows
-        lines.extend(board)
-
-        # cols
-        cols = [[board[rowidx][colidx] for rowidx in dimrng]
-                for colidx in dimrng]
-        lines.extend(cols)
-
-        # diags
-        diag1 = [board[idx][idx] for idx in dimrng]
-        diag2 = [board[idx][dim - idx -1] 
-                 for idx in dimrng]
-        lines.append(diag1)
-        lines.append(diag2)
-
-        # check all lines
-        for line in lines:
-            if len(set(line)) == 1 and line[0] != EMPTY:
-                if self._reverse:
-                    return switch_player(line[0])
-                else:
-                    return line[0]
+        if self._winner is not None:
+            if self._reverse:
+                return switch_player(self._winner)
+            else:
+                return self._winner
 
         # no winner, check for draw
-        if len(self.get_empty_squares()) == 0:
+        if self._xbits | self._obits == self._masks[2]:
             return DRAW
 
         # game is still in progress
@@ -152,7 +258,11 @@ class TTTBoard:
         """
         Return a copy of the board.
         """
-        return TTTBoard(self._dim, self._reverse, self._board)
+        board = TTTBoard(self._dim, self._reverse)
+        board._xbits = self._xbits
+        board._obits = self._obits
+        board._winner = self._winner
+        return board
 
 class TicTacGUI:
     """
@@ -378,13 +488,7 @@ def mc_trial(board, player):
     Play a game starting with the given board and player by making random moves,
     alternating between players.
     """
-    winner = board.check_win()
-    while winner == None:
-        empty_list = board.get_empty_squares()
-        empty_square = random.choice(empty_list)
-        board.move(empty_square[0], empty_square[1], player)
-        winner = board.check_win()
-        player = switch_player(player)
+    board.play_random(player)
 
 def mc_update_scores(scores, board, player):
     """
@@ -395,20 +499,18 @@ def mc_update_scores(scores, board, player):
     if winner == player:
         for row in range(dim):
             for col in range(dim):
-                if board.square(row, col) == player:
+                square = board.square(row, col)
+                if square == player:
                     scores[row][col] += SCORE_CURRENT
-                elif board.square(row, col) == EMPTY:
-                    pass
-                else:
+                elif square != EMPTY:
                     scores[row][col] -= SCORE_OTHER
     elif winner != player and winner != DRAW:
         for row in range(dim):
             for col in range(dim):
-                if board.square(row, col) == player:
+                square = board.square(row, col)
+                if square == player:
                     scores[row][col] -= SCORE_CURRENT
-                elif board.square(row, col) == EMPTY:
-                    pass
-                else:
+                elif square != EMPTY:
                     scores[row][col] += SCORE_OTHER                
     
 def get_best_move(board, scores):
@@ -430,21 +532,187 @@ def get_best_move(board, scores):
     best_move = random.choice(best_move_list)
     return best_move
 
-def mc_move(board, player, trials):
+def mc_move(board, player, trials, num_workers = 0, seed = None):
     """
     Use the Monte Carlo simulation to return a move for the machine player.
+    
+    With num_workers, the trials are spread over that many worker 
+    processes. With a seed, or with workers, they are split into 
+    MC_SHARES shares, each played from its own seed drawn from seed, 
+    and the scores of the shares are added up in share order. So a 
+    given seed always gives the same move, with any number of workers.
     """
+    if num_workers == 0 and seed == None:
+        scores = mc_scores(board, player, trials)
+        best_move = get_best_move(board, scores)
+        return best_move
+    
+    dim = board.get_dim()
+    if seed == None:
+        seed = random.randrange(1 << 30)
+    rng = random.Random(seed)
+    grid = tuple([tuple([board.square(row, col) for col in range(dim)]) 
+                  for row in range(dim)])
+    tasks = []
+    for share in range(MC_SHARES):
+        share_trials = trials * (share + 1) // MC_SHARES - trials * share // MC_SHARES
+        share_seed = rng.randrange(1 << 30)
+        if share_trials > 0:
+            tasks.append((dim, board.get_reverse(), grid, player, share_trials, share_seed))
+    if num_workers > 0 and multiprocessing is not None:
+        partials = get_mc_pool(num_workers).map(mc_share_scores, tasks)
+    else:
+        partials = [mc_share_scores(task) for task in tasks]
+    
+    scores = [[0 for dummycol in range(dim)]for dummyrow in range(dim)]
+    for partial in partials:
+        for row in range(dim):
+            for col in range(dim):
+                scores[row][col] += partial[row][col]
+    # ties are broken from the seed too, leaving the random module as it was
+    state = random.getstate()
+    random.seed(rng.randrange(1 << 30))
+    best_move = get_best_move(board, scores)
+    random.setstate(state)
+    return best_move
+
+def mc_scores(board, player, trials):
+    """
+    Play trials Monte Carlo trials from the board, in a NumPy batch 
+    when possible.
+    Returns the grid of summed scores
+    """
+    if numpy is not None and trials >= MC_BATCH_MIN_TRIALS:
+        return mc_batch_scores(board, player, trials)
     dim = board.get_dim()
     scores = [[0 for dummycol in range(dim)]for dummyrow in range(dim)]
     for dummy in range(trials):
         clone_board = board.clone()
         mc_trial(clone_board, player)        
         mc_update_scores(scores, clone_board, player)
-    best_move = get_best_move(board, scores)
-    return best_move
+    return scores
+
+def mc_share_scores(task):
+    """
+    Worker function that plays one share of the trials of mc_move 
+    with the random module seeded from the share, restoring the 
+    random module afterwards.
+    Returns the grid of summed scores of the share
+    """
+    dim, reverse, grid, player, trials, seed = task
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        return mc_scores(TTTBoard(dim, reverse, grid), player, trials)
+    finally:
+        random.setstate(state)
+
+# Worker pool of mc_move, kept between moves, see get_mc_pool
+_mc_pool = []
+
+def get_mc_pool(num_workers):
+    """
+    Start a pool of num_workers processes, or reuse the one 
+    started last if it has as many workers.
+    Returns a multiprocessing pool
+    """
+    if _mc_pool and _mc_pool[0] != num_workers:
+        close_mc_pool()
+    if not _mc_pool:
+        _mc_pool.extend([num_workers, multiprocessing.Pool(num_workers)])
+    return _mc_pool[1]
+
+def close_mc_pool():
+    """
+    Shut down the worker pool of mc_move, if any.
+    """
+    if _mc_pool:
+        _mc_pool[1].terminate()
+        _mc_pool[1].join()
+        del _mc_pool[:]
+
+# Line indices through each square for batched trials, see batch_lines
+_batch_lines = {}
+
+def batch_lines(dim):
+    """
+    Precompute, once per dimension, the squares of the lines through 
+    each square, as a (dim * dim, 4, dim) array. Squares on fewer than 
+    4 lines are padded with lines made only of square dim * dim, an 
+    extra square that always stays empty.
+    """
+    if dim not in _batch_lines:
+        padding = [dim * dim] * dim
+        lines = []
+        for row in range(dim):
+            for col in range(dim):
+                through = [[row * dim + idx for idx in range(dim)], 
+                           [idx * dim + col for idx in range(dim)]]
+                if row == col:
+                    through.append([idx * dim + idx for idx in range(dim)])
+                if row == dim - col - 1:
+                    through.append([idx * dim + dim - idx - 1 for idx in range(dim)])
+                lines.append(through + [padding] * (4 - len(through)))
+        _batch_lines[dim] = numpy.array(lines, dtype = numpy.intp)
+    return _batch_lines[dim]
+
+def mc_batch_scores(board, player, trials):
+    """
+    Play trials random games from the given board at once on NumPy 
+    arrays, starting with player, and score the completed boards the 
+    same way mc_update_scores does.
+    Returns the grid of summed scores
+    """
+    dim = board.get_dim()
+    size = dim * dim
+    other = switch_player(player)
+    lines = batch_lines(dim)
+    start = numpy.array([board.square(row, col) for row in range(dim) 
+                         for col in range(dim)] + [EMPTY], dtype = numpy.int8)
+    empties = numpy.nonzero(start[:size] == EMPTY)[0]
+    # owner of the complete line, before any reversal
+    owner = board.check_win()
+    if owner == DRAW or owner == None:
+        owner = 0
+    elif board.get_reverse():
+        owner = switch_player(owner)
+    rng = numpy.random.RandomState(random.randrange(1 << 30))
+    totals = numpy.zeros(size)
+    
+    for first in range(0, trials, MC_BATCH_SIZE):
+        count = min(MC_BATCH_SIZE, trials - first)
+        games = numpy.arange(count)
+        state = numpy.tile(start, (count, 1))
+        winners = numpy.zeros(count, dtype = numpy.int8) + owner
+        # playing the empty squares in a random order, one per turn
+        order = empties[numpy.argsort(rng.random_sample((count, len(empties))), axis = 1)]
+        for turn in range(len(empties)):
+            active = winners == 0
+            if not active.any():
+                break
+            if turn % 2 == 0:
+                mover = player
+            else:
+                mover = other
+            squares = order[:, turn]
+            state[games[active], squares[active]] = mover
+            complete = (state[games[:, None, None], lines[squares]] == mover).all(axis = 2)
+            winners[active & complete.any(axis = 1)] = mover
+        
+        if board.get_reverse():
+            winners = numpy.where(winners == 0, 0, PLAYERX + PLAYERO - winners)
+        # +1 where player won, -1 where other won, 0 for draws
+        signs = (winners == player).astype(float) - (winners == other)
+        weights = (SCORE_CURRENT * (state[:, :size] == player) - 
+                   SCORE_OTHER * (state[:, :size] == other))
+        totals += signs.dot(weights)
+    return [[float(totals[row * dim + col]) for col in range(dim)] 
+            for row in range(dim)]
   
 # Uncomment play_game() to test the game 
 # with two machine players with console if needed.
 
 # play_game(mc_move, NTRIALS, False)        
-run_gui(3, PLAYERX, mc_move, NTRIALS, False)
+
+if __name__ == "__main__":
+    run_gui(3, PLAYERX, mc_move, NTRIALS, False)